@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Benchmark Suite
+在合成数据上对转换、加载、搜索、统计和上传准备进行基准测试，并记录历史结果
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import subprocess
+import argparse
+import contextlib
+import io
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Callable, Optional
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, "..", "tools"))
+
+from synthetic_data import SyntheticDataGenerator, EXCEL_MAX_ROWS
+from excel_to_huggingface import ExcelToHuggingFaceConverter
+from stage_profiler import peak_rss_bytes
+
+DEFAULT_SIZES = "1000,10000,100000"
+DEFAULT_HISTORY = os.path.join(BENCHMARK_DIR, "history.json")
+DEFAULT_WORK_DIR = os.path.join(BENCHMARK_DIR, ".work")
+
+# 转换基准需要先生成Excel，超过该行数时跳过 (openpyxl 写入百万行耗时过长)
+DEFAULT_MAX_CONVERT_ROWS = 100000
+
+
+def git_commit() -> Optional[str]:
+    """当前代码的git提交"""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARK_DIR,
+                              check=True, capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def time_call(func: Callable, repeat: int) -> Dict[str, Any]:
+    """多次运行并记录最短和中位耗时"""
+    timings = []
+    for _ in range(repeat):
+        # 屏蔽被测代码的进度输出
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+    timings.sort()
+    return {
+        "min_s": round(timings[0], 6),
+        "median_s": round(timings[len(timings) // 2], 6),
+        "repeat": repeat
+    }
+
+
+class BenchmarkSuite:
+    def __init__(self, sizes: List[int], work_dir: str = DEFAULT_WORK_DIR, repeat: int = 3,
+                 max_convert_rows: int = DEFAULT_MAX_CONVERT_ROWS, search_term: str = "museum"):
+        self.sizes = sizes
+        self.work_dir = work_dir
+        self.repeat = repeat
+        self.max_convert_rows = min(max_convert_rows, EXCEL_MAX_ROWS)
+        self.search_term = search_term
+        self.generator = SyntheticDataGenerator()
+
+    def prepare(self, size: int) -> Dict[str, str]:
+        """生成 (或复用) 指定规模的合成工作簿和数据集"""
+        paths = {"dataset": os.path.join(self.work_dir, f"dataset_{size}")}
+        if not os.path.exists(paths["dataset"]):
+            print(f"🔄 生成 {size} 行合成数据集...")
+            self.generator.write_dataset(paths["dataset"], size)
+        if size <= self.max_convert_rows:
+            paths["workbook"] = os.path.join(self.work_dir, f"workbook_{size}.xlsx")
+            if not os.path.exists(paths["workbook"]):
+                print(f"🔄 生成 {size} 行合成工作簿...")
+                self.generator.write_workbook(paths["workbook"], size)
+        return paths
+
+    def bench_convert(self, size: int, paths: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        if "workbook" not in paths:
+            return None
+        output_dir = os.path.join(self.work_dir, f"converted_{size}")
+
+        def convert():
+            ExcelToHuggingFaceConverter(paths["workbook"], output_dir).run_conversion()
+
+        # 转换耗时较长，只运行一次
+        return time_call(convert, 1)
+
+    def bench_viewer(self, paths: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+        from dataset_viewer import DatasetViewer
+
+        viewer = DatasetViewer(paths["dataset"])
+        results = {"load_dataset": time_call(viewer.load_dataset, self.repeat)}
+        results["filter_data"] = time_call(lambda: viewer.filter_data(self.search_term), self.repeat)
+        results["compute_statistics"] = time_call(viewer.compute_statistics, self.repeat)
+        return results
+
+    def bench_upload_prepare(self, paths: Dict[str, str]) -> Dict[str, Any]:
+        from upload_to_hub import HuggingFaceUploader
+
+        uploader = HuggingFaceUploader(paths["dataset"], "benchmark/synthetic")
+        return time_call(uploader.prepare_upload, self.repeat)
+
+    def run(self) -> Dict[str, Any]:
+        """运行所有基准测试"""
+        os.makedirs(self.work_dir, exist_ok=True)
+        results = {}
+        for size in self.sizes:
+            paths = self.prepare(size)
+            print(f"⏱️ 基准测试: {size} 行")
+            size_results = {}
+            convert = self.bench_convert(size, paths)
+            if convert:
+                size_results["run_conversion"] = convert
+            try:
+                size_results.update(self.bench_viewer(paths))
+            except ImportError as e:
+                print(f"⚠️ 跳过查看器基准 (缺少依赖: {e.name})")
+            try:
+                size_results["prepare_upload"] = self.bench_upload_prepare(paths)
+            except ImportError as e:
+                print(f"⚠️ 跳过上传准备基准 (缺少依赖: {e.name})")
+            size_results["peak_rss_bytes"] = peak_rss_bytes()
+            for name, value in size_results.items():
+                if isinstance(value, dict):
+                    print(f"  {name:<20} min={value['min_s']:.4f}s median={value['median_s']:.4f}s")
+            results[str(size)] = size_results
+
+        return {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "results": results
+        }
+
+
+def load_history(path: str) -> List[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_history(path: str, history: List[Dict[str, Any]]):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(history, f, ensure_ascii=False, indent=2)
+    print(f"基准结果已保存到: {path}")
+
+
+def find_run(history: List[Dict[str, Any]], commit: str) -> Optional[Dict[str, Any]]:
+    """按提交查找最近一次运行"""
+    for run in reversed(history):
+        if run.get("commit") and run["commit"].startswith(commit):
+            return run
+    return None
+
+
+def compare_runs(base: Dict[str, Any], head: Dict[str, Any], threshold: float = 0.10) -> List[str]:
+    """比较两次运行的中位耗时，返回超过阈值的退化项"""
+    regressions = []
+    print(f"=== 对比 {base.get('commit')} → {head.get('commit')} ===")
+    for size, head_results in head["results"].items():
+        base_results = base["results"].get(size, {})
+        for name, value in head_results.items():
+            if not isinstance(value, dict) or name not in base_results:
+                continue
+            before, after = base_results[name]["median_s"], value["median_s"]
+            change = (after - before) / before if before > 0 else 0.0
+            marker = ""
+            if change > threshold:
+                marker = " ❌"
+                regressions.append(f"{size}/{name}")
+            elif change < -threshold:
+                marker = " ✅"
+            print(f"{size:>8} {name:<20} {before:.4f}s → {after:.4f}s ({change:+.1%}){marker}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="运行合成数据基准测试")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="数据规模列表，例如 1000,10000,100000,1000000")
+    parser.add_argument("--repeat", type=int, default=3, help="每项重复次数")
+    parser.add_argument("--work_dir", default=DEFAULT_WORK_DIR, help="合成数据缓存目录")
+    parser.add_argument("--history", default=DEFAULT_HISTORY, help="基准历史JSON文件")
+    parser.add_argument("--max_convert_rows", type=int, default=DEFAULT_MAX_CONVERT_ROWS,
+                        help="运行Excel转换基准的最大行数")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "HEAD"),
+                        help="只比较历史中的两个提交，不运行基准")
+    parser.add_argument("--threshold", type=float, default=0.10, help="判定为退化的耗时增长比例")
+
+    args = parser.parse_args()
+
+    history = load_history(args.history)
+    if args.compare:
+        base, head = (find_run(history, commit) for commit in args.compare)
+        if base is None or head is None:
+            print(f"❌ 历史中找不到提交: {args.compare}")
+            sys.exit(2)
+    else:
+        sizes = [int(size) for size in args.sizes.split(",")]
+        suite = BenchmarkSuite(sizes, args.work_dir, args.repeat, args.max_convert_rows)
+        head = suite.run()
+        base = history[-1] if history else None
+        history.append(head)
+        save_history(args.history, history)
+        if base is None:
+            return
+
+    regressions = compare_runs(base, head, args.threshold)
+    if regressions:
+        print(f"❌ 性能退化: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Synthetic Data Generator
+按转换器的特征结构生成合成Excel工作簿和Hugging Face数据集，用于基准测试
+"""
+
+import os
+import sys
+import shutil
+import argparse
+import numpy as np
+import pandas as pd
+from typing import Dict, Iterator, List, Any
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
+
+from excel_to_huggingface import ExcelToHuggingFaceConverter, DICTIONARY_MAX_RATIO
+from dataset_query import finalize_split
+
+# Excel单个工作表的最大行数 (含表头)
+EXCEL_MAX_ROWS = 1048575
+
+# 与原始数据集接近的长度分布 (字符数)
+ESSAY_LENGTH = (1793, 318)
+FEEDBACK_LENGTH = (766, 150)
+SUGGESTION_LENGTH = (900, 200)
+PROMPT_LENGTH = (220, 40)
+
+WORDS = (
+    "people government education technology society museum online students teachers "
+    "children parents public private important benefit advantage disadvantage however "
+    "therefore moreover although environment economy city country culture history art "
+    "computer internet young older generation opinion believe argue agree disagree "
+    "example instance because result increase decrease problem solution should could "
+    "would essay paragraph argument coherence vocabulary grammar structure task response "
+    "cohesive devices range accuracy sentence clear idea support develop position"
+).split()
+
+FEEDBACK_TEMPLATES = [
+    "The essay addresses all parts of the task with a clear position throughout.",
+    "Ideas are logically organised and there is clear progression throughout.",
+    "A wide range of vocabulary is used fluently and flexibly.",
+    "A variety of complex structures is used with frequent error-free sentences.",
+    "Some ideas could be more fully extended and supported with examples.",
+    "Cohesive devices are used effectively but occasionally overused.",
+    "There are occasional errors in word choice and collocation.",
+    "Punctuation errors and minor grammatical slips appear in longer sentences.",
+    "The conclusion restates the position but adds little new insight.",
+    "Paragraphing is appropriate and each paragraph has a clear central topic."
+]
+
+
+def feature_columns() -> Dict[str, str]:
+    """从转换器配置中读取特征名和类型"""
+    converter = ExcelToHuggingFaceConverter("synthetic.xlsx")
+    converter.df = pd.DataFrame()
+    features = converter.create_dataset_config()["features"]
+    return {name: spec["dtype"] for name, spec in features.items()}
+
+
+class SyntheticDataGenerator:
+    def __init__(self, seed: int = 0):
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        self.sentences = [self._sentence(rng) for _ in range(4096)]
+        self.columns = feature_columns()
+
+    def _sentence(self, rng: np.random.Generator) -> str:
+        words = rng.choice(WORDS, size=rng.integers(8, 25))
+        return " ".join(words).capitalize() + "."
+
+    def _text(self, rng: np.random.Generator, length: tuple, pool: List[str] = None) -> str:
+        """拼接句子直到达到目标长度"""
+        target = max(50, int(rng.normal(*length)))
+        pool = pool or self.sentences
+        parts, total = [], 0
+        while total < target:
+            sentence = pool[rng.integers(len(pool))]
+            parts.append(sentence)
+            total += len(sentence) + 1
+        return " ".join(parts)
+
+    def rows(self, num_rows: int, chunk_size: int = 10000) -> Iterator[pd.DataFrame]:
+        """按块生成与转换器特征结构一致的数据"""
+        prompt_rng = np.random.default_rng(self.seed + 1)
+        # 原始数据中约100篇作文对应74个题目，题目数随规模次线性增长
+        num_prompts = max(1, int(7.4 * np.sqrt(num_rows)))
+        prompts = [self._text(prompt_rng, PROMPT_LENGTH) + " To what extent do you agree or disagree?"
+                   for _ in range(min(num_prompts, 5000))]
+
+        for start in range(0, num_rows, chunk_size):
+            rng = np.random.default_rng([self.seed, start])
+            n = min(chunk_size, num_rows - start)
+            scores = {name: np.clip(np.round(rng.normal(6, 0.8, n)), 0, 9).astype("int64")
+                      for name in ["Score_TR", "Score_CC", "Score_LR", "Score_GRA"]}
+            overall = np.round(np.mean(list(scores.values()), axis=0)).astype("int64")
+
+            data: Dict[str, Any] = {}
+            for name, dtype in self.columns.items():
+                if name == "Essay_id":
+                    data[name] = np.arange(start + 1, start + n + 1, dtype="int64")
+                elif name in ("Essay_score", "Overall_score"):
+                    data[name] = overall
+                elif name in scores:
+                    data[name] = scores[name]
+                elif name == "Essay_Prompt":
+                    data[name] = [prompts[i] for i in rng.integers(len(prompts), size=n)]
+                elif name == "Essay":
+                    data[name] = [self._text(rng, ESSAY_LENGTH) for _ in range(n)]
+                elif name.startswith("Feedback_"):
+                    data[name] = [self._text(rng, FEEDBACK_LENGTH, FEEDBACK_TEMPLATES) for _ in range(n)]
+                elif dtype == "string":
+                    data[name] = [self._text(rng, SUGGESTION_LENGTH) for _ in range(n)]
+                else:
+                    data[name] = np.zeros(n, dtype=dtype)
+            yield pd.DataFrame(data)
+
+    def write_workbook(self, path: str, num_rows: int) -> str:
+        """生成合成Excel工作簿"""
+        if num_rows > EXCEL_MAX_ROWS:
+            raise ValueError(f"Excel工作表最多 {EXCEL_MAX_ROWS} 行数据，无法生成 {num_rows} 行")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        df = pd.concat(self.rows(num_rows), ignore_index=True)
+        df.to_excel(path, index=False)
+        return path
+
+    def write_dataset(self, path: str, num_rows: int, chunk_size: int = 10000,
+                      dictionary_ratio: float = DICTIONARY_MAX_RATIO) -> str:
+        """逐块生成合成数据集并以 save_to_disk 格式保存，后处理与转换器一致"""
+        from datasets import Dataset, DatasetDict, Features, Value
+
+        features = Features({name: Value(dtype) for name, dtype in self.columns.items()})
+        # 与转换器相同的规则：不同取值数 / 行数不超过 dictionary_ratio 的文本列字典编码；
+        # 生成时只保留各列取值的64位哈希，超过上限即不再跟踪
+        limit = dictionary_ratio * num_rows
+        distinct = {name: np.empty(0, dtype=np.uint64)
+                    for name, dtype in self.columns.items() if dtype == "string"} if num_rows else {}
+
+        def generate(num_rows):
+            for chunk in self.rows(num_rows, chunk_size):
+                for name in list(distinct):
+                    hashes = pd.util.hash_pandas_object(chunk[name], index=False).to_numpy()
+                    distinct[name] = np.union1d(distinct[name], hashes)
+                    if len(distinct[name]) > limit:
+                        del distinct[name]
+                yield from chunk.to_dict('records')
+
+        # 残留的缓存会让 from_generator 跳过生成，取值统计也随之缺失
+        cache_dir = os.path.abspath(path) + ".cache"
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        dataset = Dataset.from_generator(generate, features=features, cache_dir=cache_dir,
+                                         gen_kwargs={"num_rows": num_rows})
+        DatasetDict({"train": dataset}).save_to_disk(path)
+        del dataset
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        finalize_split(os.path.join(path, "train"), list(distinct))
+        return path
+
+def main():
+    parser = argparse.ArgumentParser(description="生成合成作文评分数据")
+    parser.add_argument("--rows", "-n", type=int, default=1000, help="生成行数")
+    parser.add_argument("--workbook", "-w", help="输出Excel工作簿路径")
+    parser.add_argument("--dataset", "-d", help="输出Hugging Face数据集路径")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+
+    args = parser.parse_args()
+
+    generator = SyntheticDataGenerator(args.seed)
+    if args.workbook:
+        generator.write_workbook(args.workbook, args.rows)
+        print(f"工作簿已保存到: {args.workbook}")
+    if args.dataset:
+        generator.write_dataset(args.dataset, args.rows)
+        print(f"数据集已保存到: {args.dataset}")
+
+
+if __name__ == "__main__":
+    main()
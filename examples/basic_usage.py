@@ -6,6 +6,13 @@ Basic Usage Example
 
 from datasets import load_dataset
 import pandas as pd
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
+from dataset_query import IdIndex
+
+LOCAL_DATASET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dataset")
 
 def main():
     print("🚀 加载数据集...")
@@ -29,6 +36,22 @@ def main():
     print(f"📊 DataFrame形状: {df.shape}")
     print(f"📋 前5行数据:")
     print(df.head())
+    
+    lookup_by_id()
+
+def lookup_by_id():
+    """用Essay_id主键索引直接读取指定作文，无需转换为DataFrame再筛选"""
+    print("\n🔎 按Essay_id查找...")
+    index = IdIndex(os.path.join(LOCAL_DATASET, "train"))
+    essay_ids = [int(i) for i in index.ids[:3]]
+    
+    # 单个ID
+    essay = index.get(essay_ids[0], columns=["Essay_id", "Essay_score", "Essay_Prompt"])
+    print(f"📝 Essay_id={essay_ids[0]}: {essay}")
+    
+    # 批量ID，结果按请求顺序返回，不存在的ID被跳过
+    table = index.fetch(essay_ids + [-1], columns=["Essay_id", "Essay_score"])
+    print(table.to_pandas())
 
 if __name__ == "__main__":
     main()
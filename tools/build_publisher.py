@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Build Publisher
+每次转换写入新的版本化构建目录，fsync 后通过原子替换 current 链接发布；
+读者对所用构建持有共享锁，不再被任何读者使用的旧构建才会被回收
+"""
+
+import os
+import time
+import shutil
+import argparse
+from typing import List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows 上没有 flock，此时不回收旧构建
+    fcntl = None
+
+BUILDS_DIR = "builds"
+CURRENT_LINK = "current"
+# 输出目录中指向当前构建的固定链接，保持原有的 output_dir/dataset 等路径可用
+PUBLISHED_ENTRIES = ["dataset", "dataset_info.json", "README.md"]
+
+
+def _fsync_path(path: str):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def fsync_tree(path: str):
+    """将目录下所有文件和目录项刷到磁盘，子目录先于父目录"""
+    for root, dirs, files in os.walk(path, topdown=False):
+        for name in files:
+            _fsync_path(os.path.join(root, name))
+        _fsync_path(root)
+
+
+def build_of(path: str) -> Optional[str]:
+    """返回路径 (解析链接后) 所属的构建目录；不是已发布的构建时返回None"""
+    path = os.path.realpath(path)
+    while True:
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        if os.path.basename(parent) == BUILDS_DIR:
+            return path
+        path = parent
+
+
+def current_build(output_dir: str) -> Optional[str]:
+    """输出目录当前发布的构建；旧的就地写入布局返回None"""
+    link = os.path.join(output_dir, CURRENT_LINK)
+    return os.path.realpath(link) if os.path.islink(link) else None
+
+
+def _lock_path(build_dir: str) -> str:
+    # 锁文件放在构建目录之外，不会被快照存储或上传包含进去
+    return f"{build_dir}.lock"
+
+
+class SnapshotLease:
+    """读者对数据集所在构建的共享锁，持有期间该构建不会被回收
+
+    path 可以是 output_dir/dataset 这样的链接路径；changed() 检查链接是否已指向新构建。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.resolved = None
+        self.build_dir = None
+        self._lock_file = None
+        self.acquire()
+
+    def acquire(self):
+        while True:
+            resolved = os.path.realpath(self.path)
+            if not os.path.exists(resolved):
+                raise FileNotFoundError(f"数据集路径不存在: {self.path}")
+            build_dir = build_of(resolved)
+            if build_dir is None or fcntl is None:
+                break
+            try:
+                lock_file = open(_lock_path(build_dir), 'r')
+            except FileNotFoundError:
+                if os.path.isdir(build_dir) and os.path.realpath(self.path) == resolved:
+                    # 构建仍在但缺少锁文件 (被手动删除等)，重新创建后加锁
+                    lock_file = open(_lock_path(build_dir), 'a')
+                else:
+                    continue  # 构建刚被回收，重新解析链接
+            fcntl.flock(lock_file, fcntl.LOCK_SH)
+            # 加锁前构建可能已被回收 (锁文件已被删除)，此时重新解析
+            if os.path.isdir(build_dir) and os.path.exists(lock_file.name) \
+                    and os.stat(lock_file.name).st_ino == os.fstat(lock_file.fileno()).st_ino:
+                self._lock_file = lock_file
+                break
+            lock_file.close()
+        self.resolved = resolved
+        self.build_dir = build_dir
+        return resolved
+
+    def changed(self) -> bool:
+        return os.path.realpath(self.path) != self.resolved
+
+    def release(self, collect: bool = False):
+        """释放共享锁；collect 为真时顺便回收已无人使用的旧构建"""
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+        if collect and self.build_dir:
+            collect_builds(self.build_dir)
+
+    def __del__(self):
+        self.release()
+
+
+class BuildPublisher:
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+        self.builds_dir = os.path.join(output_dir, BUILDS_DIR)
+        self._building = {}
+
+    def builds(self) -> List[str]:
+        if not os.path.isdir(self.builds_dir):
+            return []
+        return sorted(name for name in os.listdir(self.builds_dir)
+                      if os.path.isdir(os.path.join(self.builds_dir, name)))
+
+    def new_build(self) -> str:
+        """创建新的构建目录；先对锁文件加共享锁再建目录，避免被并发的回收删除"""
+        os.makedirs(self.builds_dir, exist_ok=True)
+        stamp, n = time.strftime('%Y%m%d-%H%M%S'), 0
+        while True:
+            build_dir = os.path.join(self.builds_dir, f"{stamp}-{os.getpid()}-{n}")
+            if not os.path.lexists(build_dir) and not os.path.exists(_lock_path(build_dir)):
+                break
+            n += 1
+        lock_file = open(_lock_path(build_dir), 'a')
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_SH)
+        os.makedirs(build_dir)
+        self._building[build_dir] = lock_file
+        return build_dir
+
+    def _replace_link(self, name: str, target: str):
+        path = os.path.join(self.output_dir, name)
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        if os.path.lexists(tmp_path):
+            os.remove(tmp_path)
+        os.symlink(target, tmp_path)
+        os.replace(tmp_path, path)
+
+    def _migrate_legacy(self):
+        """把旧的就地写入布局移入一个构建目录，之后由链接替代"""
+        legacy = [name for name in PUBLISHED_ENTRIES
+                  if os.path.lexists(os.path.join(self.output_dir, name))
+                  and not os.path.islink(os.path.join(self.output_dir, name))]
+        if not legacy:
+            return
+        legacy_dir = os.path.join(self.builds_dir, f"legacy-{time.strftime('%Y%m%d-%H%M%S')}")
+        os.makedirs(legacy_dir)
+        open(_lock_path(legacy_dir), 'a').close()
+        for name in legacy:
+            os.replace(os.path.join(self.output_dir, name), os.path.join(legacy_dir, name))
+        print(f"旧数据集已移入: {legacy_dir}")
+
+    def publish(self, build_dir: str, collect: bool = True) -> str:
+        """fsync 新构建并原子切换 current 链接，返回发布的构建目录"""
+        fsync_tree(build_dir)
+        _fsync_path(self.builds_dir)
+
+        # rename 是原子的：读者只会看到完整的旧构建或完整的新构建
+        self._replace_link(CURRENT_LINK, os.path.join(BUILDS_DIR, os.path.basename(build_dir)))
+        self._migrate_legacy()
+        for name in PUBLISHED_ENTRIES:
+            target = os.path.join(CURRENT_LINK, name)
+            path = os.path.join(self.output_dir, name)
+            if not (os.path.islink(path) and os.readlink(path) == target):
+                self._replace_link(name, target)
+        _fsync_path(self.output_dir)
+
+        lock_file = self._building.pop(build_dir, None)
+        if lock_file:
+            lock_file.close()
+        print(f"已发布构建: {os.path.basename(build_dir)}")
+        if collect:
+            self.collect()
+        return build_dir
+
+    def discard(self, build_dir: str):
+        """放弃未发布的构建"""
+        lock_file = self._building.pop(build_dir, None)
+        if lock_file:
+            lock_file.close()
+        shutil.rmtree(build_dir, ignore_errors=True)
+        if os.path.exists(_lock_path(build_dir)):
+            os.remove(_lock_path(build_dir))
+
+    def collect(self) -> List[str]:
+        """回收没有读者持有共享锁的旧构建，返回被删除的构建"""
+        if fcntl is None:
+            return []
+        current = current_build(self.output_dir)
+        removed = []
+        for name in self.builds():
+            build_dir = os.path.join(self.builds_dir, name)
+            if current and os.path.realpath(build_dir) == current:
+                continue
+            lock_path = _lock_path(build_dir)
+            with open(lock_path, 'a') as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # 仍有读者在使用
+                # 循环期间可能有新构建发布，持有排他锁后重新确认它不是当前构建
+                current = current_build(self.output_dir)
+                if current and os.path.realpath(build_dir) == current:
+                    continue
+                # 持有排他锁时删除，刚打开锁文件的读者加锁后会发现构建已不存在
+                shutil.rmtree(build_dir)
+                os.remove(lock_path)
+            removed.append(name)
+        if removed:
+            print(f"已回收旧构建: {removed}")
+        return removed
+
+
+def collect_builds(path: str) -> List[str]:
+    """回收路径所属输出目录中无人使用的旧构建"""
+    build_dir = build_of(path)
+    if build_dir is None:
+        return []
+    return BuildPublisher(os.path.dirname(os.path.dirname(build_dir))).collect()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="管理转换器输出目录中的版本化构建")
+    parser.add_argument("command", choices=["list", "gc"], help="list: 列出构建；gc: 回收无人使用的旧构建")
+    parser.add_argument("--output_dir", "-o", default="huggingface_dataset", help="转换器输出目录")
+
+    args = parser.parse_args()
+
+    publisher = BuildPublisher(args.output_dir)
+    if args.command == "list":
+        current = current_build(args.output_dir)
+        for name in publisher.builds():
+            marker = "*" if current and os.path.basename(current) == name else " "
+            print(f"{marker} {name}")
+    else:
+        removed = publisher.collect()
+        if not removed:
+            print("没有可回收的构建")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+Dataset JSON Server
+基于asyncio的轻量HTTP服务，为静态 index.html 查看器提供分页、搜索、详情和统计接口
+"""
+
+import os
+import json
+import gzip
+import asyncio
+import time
+import hashlib
+import argparse
+import threading
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qs, unquote
+from typing import Dict, Any, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from dataset_query import IdIndex, ID_COLUMN, dataset_fingerprint, text_contains
+from build_publisher import SnapshotLease
+
+# 与 index.html 中的搜索范围保持一致
+SEARCH_COLUMNS = ['Essay', 'Essay_Prompt', 'Suggestion for improvement']
+SCORE_COLUMNS = ['Essay_score', 'Overall_score', 'Score_TR', 'Score_CC', 'Score_LR', 'Score_GRA']
+
+MAX_PAGE_SIZE = 500
+GZIP_MIN_BYTES = 1024
+KEEP_ALIVE_TIMEOUT = 15
+MAX_HEADER_BYTES = 16384
+RESPONSE_CACHE_SIZE = 512
+# 检查数据集链接是否指向新构建的最短间隔 (秒)
+SNAPSHOT_CHECK_INTERVAL = 1.0
+
+STATUS_TEXT = {
+    200: "OK",
+    304: "Not Modified",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    431: "Request Header Fields Too Large",
+    500: "Internal Server Error"
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class DataStore:
+    """内存映射的数据集及其预计算统计"""
+
+    def __init__(self, dataset_path: str, split: str = "train", search_cache_size: int = 128):
+        self.dataset_path = dataset_path
+        self.split = split
+        # 持有所用构建的共享锁，并从解析后的构建目录读取，转换器重新发布时不受影响
+        self.lease = SnapshotLease(dataset_path)
+        snapshot_path = self.lease.resolved
+        # 主键索引同时持有内存映射的表，按Essay_id取行无需扫描
+        self.index = IdIndex(os.path.join(snapshot_path, split))
+        self.table = self.index.table
+        self.fingerprint = dataset_fingerprint(snapshot_path)
+        self.stats = self.compute_stats()
+        self.search_cache: "OrderedDict[str, pa.Array]" = OrderedDict()
+        self.search_cache_size = search_cache_size
+        # 搜索在 asyncio.to_thread 的工作线程中执行，缓存读写需要加锁
+        self.search_lock = threading.Lock()
+        print(f"✅ 已加载 {self.table.num_rows} 行 (指纹 {self.fingerprint})")
+
+    def close(self):
+        """不再使用该构建，释放共享锁并回收无人使用的旧构建"""
+        self.lease.release(collect=True)
+
+    def compute_stats(self) -> Dict[str, Any]:
+        """预计算查看器首页需要的统计信息"""
+        stats = {"total": self.table.num_rows, "columns": self.table.column_names, "scores": {}}
+        for name in SCORE_COLUMNS:
+            if name not in self.table.column_names:
+                continue
+            column = self.table.column(name)
+            min_max = pc.min_max(column)
+            mean = pc.mean(column).as_py()
+            stats["scores"][name] = {
+                "mean": round(mean, 2) if mean is not None else None,
+                "min": min_max["min"].as_py(),
+                "max": min_max["max"].as_py()
+            }
+        return stats
+
+    def project(self, table: pa.Table, columns: Optional[List[str]]) -> pa.Table:
+        if not columns:
+            return table
+        unknown = [name for name in columns if name not in table.column_names]
+        if unknown:
+            raise HTTPError(400, f"unknown columns: {unknown}")
+        return table.select(columns)
+
+    def rows(self, offset: int, limit: int, columns: Optional[List[str]]) -> Dict[str, Any]:
+        page = self.project(self.table, columns).slice(offset, limit)
+        return {"total": self.table.num_rows, "offset": offset, "rows": page.to_pylist()}
+
+    def search_indices(self, term: str) -> pa.Array:
+        """返回包含搜索词的行号，结果按最近使用缓存"""
+        key = term.lower()
+        with self.search_lock:
+            if key in self.search_cache:
+                self.search_cache.move_to_end(key)
+                return self.search_cache[key]
+
+        mask = None
+        for name in SEARCH_COLUMNS:
+            if name not in self.table.column_names:
+                continue
+            matched = text_contains(self.table.column(name), term)
+            mask = matched if mask is None else pc.or_(mask, matched)
+        indices = pc.indices_nonzero(pc.fill_null(mask, False)) if mask is not None else pa.array([], pa.uint64())
+
+        with self.search_lock:
+            self.search_cache[key] = indices
+            self.search_cache.move_to_end(key)
+            if len(self.search_cache) > self.search_cache_size:
+                self.search_cache.popitem(last=False)
+        return indices
+
+    def search(self, term: str, offset: int, limit: int, columns: Optional[List[str]]) -> Dict[str, Any]:
+        indices = self.search_indices(term)
+        page = self.project(self.table, columns).take(indices[offset:offset + limit])
+        return {"total": len(indices), "offset": offset, "rows": page.to_pylist()}
+
+    def essay(self, essay_id: int, columns: Optional[List[str]] = None) -> Dict[str, Any]:
+        self.project(self.table, columns)
+        if ID_COLUMN not in self.table.column_names:
+            raise HTTPError(404, f"dataset has no {ID_COLUMN} column")
+        row = self.index.get(essay_id, columns)
+        if row is None:
+            raise HTTPError(404, f"essay {essay_id} not found")
+        return row
+
+    def essays(self, essay_ids: List[int], columns: Optional[List[str]] = None) -> Dict[str, Any]:
+        """批量按ID取行，结果按请求顺序排列"""
+        self.project(self.table, columns)
+        if ID_COLUMN not in self.table.column_names:
+            raise HTTPError(404, f"dataset has no {ID_COLUMN} column")
+        positions = self.index.positions(essay_ids)
+        rows = self.index.fetch(essay_ids, columns).to_pylist()
+        missing = [essay_id for essay_id, position in zip(essay_ids, positions) if position < 0]
+        return {"rows": rows, "missing": missing}
+
+
+class DataServer:
+    def __init__(self, store: DataStore, index_file: Optional[str] = None):
+        self.store = store
+        self.index_file = index_file
+        # 已编码 (含gzip) 的响应体，热门页面无需重复序列化和压缩
+        self.response_cache: "OrderedDict[Tuple[str, bool], Tuple[bytes, str, bool]]" = OrderedDict()
+        self.last_snapshot_check = time.monotonic()
+        self.reloading = False
+
+    async def refresh_store(self):
+        """数据集链接指向新发布的构建时，在后台加载新构建后再切换，期间继续使用旧构建"""
+        now = time.monotonic()
+        if self.reloading or now - self.last_snapshot_check < SNAPSHOT_CHECK_INTERVAL:
+            return
+        self.last_snapshot_check = now
+        if not self.store.lease.changed():
+            return
+
+        self.reloading = True
+        try:
+            store = await asyncio.to_thread(DataStore, self.store.dataset_path, self.store.split,
+                                            self.store.search_cache_size)
+        except Exception as e:
+            print(f"❌ 加载新构建失败，继续使用当前构建: {e}")
+            return
+        finally:
+            self.reloading = False
+        old_store, self.store = self.store, store
+        self.response_cache.clear()
+        print(f"🔄 已切换到新构建 (指纹 {store.fingerprint})")
+        await asyncio.to_thread(old_store.close)
+
+    def _int_param(self, params: Dict[str, List[str]], name: str, default: int, maximum: int = None) -> int:
+        try:
+            value = int(params.get(name, [default])[0])
+        except ValueError:
+            raise HTTPError(400, f"invalid {name}")
+        if value < 0:
+            raise HTTPError(400, f"invalid {name}")
+        return min(value, maximum) if maximum is not None else value
+
+    async def route(self, path: str, params: Dict[str, List[str]]) -> Tuple[bytes, str]:
+        """返回响应体和Content-Type"""
+        if path in ("/", "/index.html") and self.index_file:
+            with open(self.index_file, 'rb') as f:
+                return f.read(), "text/html; charset=utf-8"
+
+        columns = params["columns"][0].split(",") if params.get("columns") else None
+        offset = self._int_param(params, "offset", 0)
+        limit = self._int_param(params, "limit", 20, MAX_PAGE_SIZE)
+
+        if path == "/api/stats":
+            payload = self.store.stats
+        elif path == "/api/rows":
+            payload = self.store.rows(offset, limit, columns)
+        elif path == "/api/search":
+            term = params.get("q", [""])[0]
+            if not term:
+                payload = self.store.rows(offset, limit, columns)
+            else:
+                # 大数据集上的全文匹配放到线程中执行，pyarrow计算会释放GIL
+                payload = await asyncio.to_thread(self.store.search, term, offset, limit, columns)
+        elif path.startswith("/api/essays/"):
+            try:
+                essay_id = int(path.rsplit("/", 1)[1])
+            except ValueError:
+                raise HTTPError(400, "invalid essay id")
+            payload = self.store.essay(essay_id, columns)
+        elif path == "/api/essays":
+            try:
+                essay_ids = [int(v) for v in params.get("ids", [""])[0].split(",") if v]
+            except ValueError:
+                raise HTTPError(400, "invalid essay ids")
+            if len(essay_ids) > MAX_PAGE_SIZE:
+                raise HTTPError(400, f"at most {MAX_PAGE_SIZE} ids per request")
+            payload = self.store.essays(essay_ids, columns)
+        else:
+            raise HTTPError(404, f"not found: {path}")
+
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        return body, "application/json; charset=utf-8"
+
+    async def encoded_response(self, target: str, url, use_gzip: bool) -> Tuple[bytes, str, bool]:
+        """生成 (或从缓存读取) 响应体，返回 (响应体, Content-Type, 是否gzip)"""
+        key = (target, use_gzip)
+        cacheable = url.path.startswith("/api/")
+        if cacheable and key in self.response_cache:
+            self.response_cache.move_to_end(key)
+            return self.response_cache[key]
+
+        body, content_type = await self.route(unquote(url.path), parse_qs(url.query))
+        gzipped = use_gzip and len(body) >= GZIP_MIN_BYTES
+        if gzipped:
+            body = gzip.compress(body, compresslevel=5)
+        if cacheable:
+            self.response_cache[key] = (body, content_type, gzipped)
+            if len(self.response_cache) > RESPONSE_CACHE_SIZE:
+                self.response_cache.popitem(last=False)
+        return body, content_type, gzipped
+
+    def etag(self, target: str) -> str:
+        """响应内容只由数据集指纹和请求目标决定，无需生成响应体即可比较"""
+        digest = hashlib.blake2b(f"{self.store.fingerprint}:{target}".encode(), digest_size=8).hexdigest()
+        return f'W/"{digest}"'
+
+    async def read_request(self, reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str]]]:
+        try:
+            raw = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEP_ALIVE_TIMEOUT)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            return None
+        except asyncio.LimitOverrunError:
+            raise HTTPError(431, "headers too large")
+
+        lines = raw.decode("latin-1").split("\r\n")
+        try:
+            method, target, version = lines[0].split(" ", 2)
+        except ValueError:
+            raise HTTPError(400, "malformed request line")
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        headers[":version"] = version
+        return method, target, headers
+
+    def build_response(self, status: int, body: bytes, content_type: str,
+                       keep_alive: bool, extra: Dict[str, str] = None, head: bool = False) -> bytes:
+        headers = {
+            "Content-Type": content_type,
+            "Content-Length": str(len(body)),
+            "Access-Control-Allow-Origin": "*",
+            "Connection": "keep-alive" if keep_alive else "close"
+        }
+        if keep_alive:
+            headers["Keep-Alive"] = f"timeout={KEEP_ALIVE_TIMEOUT}"
+        headers.update(extra or {})
+        head_lines = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}"]
+        head_lines += [f"{name}: {value}" for name, value in headers.items()]
+        response = ("\r\n".join(head_lines) + "\r\n\r\n").encode("latin-1")
+        return response if head else response + body
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """处理一个连接上的多个请求 (HTTP/1.1 keep-alive)"""
+        try:
+            while True:
+                keep_alive = False
+                try:
+                    request = await self.read_request(reader)
+                    if request is None:
+                        break
+                    method, target, headers = request
+                    connection = headers.get("connection", "").lower()
+                    keep_alive = connection != "close" if headers[":version"] == "HTTP/1.1" else connection == "keep-alive"
+                    if method not in ("GET", "HEAD"):
+                        raise HTTPError(405, "only GET and HEAD are supported")
+                    await self.refresh_store()
+
+                    url = urlsplit(target)
+                    cache_headers = {"Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+                    if url.path.startswith("/api/"):
+                        etag = self.etag(target)
+                        cache_headers["ETag"] = etag
+                        if etag in [tag.strip() for tag in headers.get("if-none-match", "").split(",")]:
+                            writer.write(self.build_response(304, b"", "application/json", keep_alive,
+                                                             cache_headers, head=True))
+                            await writer.drain()
+                            continue
+
+                    use_gzip = "gzip" in headers.get("accept-encoding", "")
+                    body, content_type, gzipped = await self.encoded_response(target, url, use_gzip)
+                    if gzipped:
+                        cache_headers["Content-Encoding"] = "gzip"
+                    writer.write(self.build_response(200, body, content_type, keep_alive, cache_headers,
+                                                     head=(method == "HEAD")))
+                except HTTPError as e:
+                    body = json.dumps({"error": e.message}).encode("utf-8")
+                    writer.write(self.build_response(e.status, body, "application/json", keep_alive))
+                except Exception as e:
+                    print(f"❌ 请求处理失败: {e}")
+                    body = json.dumps({"error": "internal error"}).encode("utf-8")
+                    keep_alive = False
+                    writer.write(self.build_response(500, body, "application/json", keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str, port: int):
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_HEADER_BYTES, backlog=1024)
+        print(f"🌐 数据服务已启动: http://{host}:{port}")
+        if self.index_file:
+            print(f"🔗 查看器地址: http://{host}:{port}/?api=http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="为 index.html 提供本地数据集的JSON接口")
+    parser.add_argument("--dataset_path", "-d", default="huggingface_dataset/dataset", help="本地数据集路径")
+    parser.add_argument("--split", default="train", help="数据集划分")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", "-p", type=int, default=8000, help="监听端口")
+    parser.add_argument("--index_file", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "index.html"),
+                        help="在根路径提供的查看器页面")
+
+    args = parser.parse_args()
+
+    store = DataStore(args.dataset_path, args.split)
+    index_file = args.index_file if os.path.exists(args.index_file) else None
+    server = DataServer(store, index_file)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("\n👋 服务器已停止")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Dataset Export
+将筛选、排序后的行按块从内存映射的Arrow表流式写出为 CSV / Parquet / JSONL，内存占用与结果大小无关
+"""
+
+import os
+import json
+import argparse
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from typing import List, Optional, Iterator, Callable
+
+from dataset_query import open_split_table, text_contains, take_rows, batch_offsets
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "jsonl": "application/x-ndjson"
+}
+DEFAULT_CHUNK_SIZE = 5000
+
+
+def text_columns(schema: pa.Schema) -> List[str]:
+    """字符串列和字典编码的字符串列"""
+    names = []
+    for field in schema:
+        value_type = field.type.value_type if pa.types.is_dictionary(field.type) else field.type
+        if pa.types.is_string(value_type) or pa.types.is_large_string(value_type):
+            names.append(field.name)
+    return names
+
+
+def _sort_key(table: pa.Table, name: str) -> pa.ChunkedArray:
+    """排序键；字典编码列统一字典后按字典值的名次排序，不展开字符串"""
+    column = table.column(name)
+    if not pa.types.is_dictionary(column.type) or column.num_chunks == 0:
+        return column
+    column = table.select([name]).unify_dictionaries().column(0)
+    ranks = pc.rank(column.chunk(0).dictionary, sort_keys="ascending", tiebreaker="dense")
+    return pa.chunked_array([pc.take(ranks, chunk.indices) for chunk in column.chunks], type=ranks.type)
+
+
+def select_rows(table: pa.Table, search_term: str = "", sort_by: Optional[str] = None,
+                descending: bool = False) -> Optional[np.ndarray]:
+    """在所有文本列中做子串搜索并排序，返回行号；不筛选也不排序时返回None表示全部行"""
+    indices = None
+    if search_term:
+        mask = None
+        for name in text_columns(table.schema):
+            matched = text_contains(table.column(name), search_term)
+            mask = matched if mask is None else pc.or_(mask, matched)
+        if mask is not None:
+            indices = np.flatnonzero(pc.fill_null(mask, False).to_numpy(zero_copy_only=False))
+    if sort_by:
+        keys = _sort_key(table, sort_by)
+        if indices is not None:
+            keys = keys.take(indices)
+        order = pc.sort_indices(pa.table({sort_by: keys}),
+                                sort_keys=[(sort_by, "descending" if descending else "ascending")]).to_numpy()
+        indices = order if indices is None else indices[order]
+    return indices
+
+
+def iter_chunks(table: pa.Table, columns: Optional[List[str]] = None,
+                indices: Optional[np.ndarray] = None,
+                chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[pa.Table]:
+    """按块取出选中的行和列，每块只复制本块用到的行"""
+    projected = table.select(columns) if columns else table
+    if indices is None:
+        for start in range(0, projected.num_rows, chunk_size):
+            yield projected.slice(start, chunk_size)
+        return
+    batches = projected.to_batches()
+    offsets = batch_offsets(batches)
+    for start in range(0, len(indices), chunk_size):
+        part = np.asarray(indices[start:start + chunk_size], dtype=np.int64)
+        if len(part):
+            yield take_rows(batches, offsets, part, projected.schema)
+
+
+class _JsonLinesWriter:
+    def __init__(self, path: str):
+        self.file = open(path, 'w', encoding='utf-8')
+
+    def write_table(self, table: pa.Table):
+        for row in table.to_pylist():
+            self.file.write(json.dumps(row, ensure_ascii=False))
+            self.file.write("\n")
+
+    def close(self):
+        self.file.close()
+
+
+def _open_writer(path: str, fmt: str, schema: pa.Schema):
+    if fmt == "csv":
+        return pa_csv.CSVWriter(path, schema)
+    if fmt == "parquet":
+        return pq.ParquetWriter(path, schema)
+    if fmt == "jsonl":
+        return _JsonLinesWriter(path)
+    raise ValueError(f"不支持的导出格式: {fmt}")
+
+
+def export_rows(table: pa.Table, output_path: str, fmt: Optional[str] = None,
+                columns: Optional[List[str]] = None, indices: Optional[np.ndarray] = None,
+                chunk_size: int = DEFAULT_CHUNK_SIZE,
+                progress: Optional[Callable[[int, int], None]] = None) -> int:
+    """流式导出选中的行，返回写出的行数；先写临时文件再原子替换"""
+    fmt = fmt or os.path.splitext(output_path)[1].lstrip(".").lower()
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"不支持的导出格式: {fmt}，可选: {', '.join(EXPORT_FORMATS)}")
+    for name in columns or []:
+        if name not in table.column_names:
+            raise ValueError(f"列不存在: {name}")
+
+    total = table.num_rows if indices is None else len(indices)
+    schema = table.select(columns).schema if columns else table.schema
+    tmp_path = f"{output_path}.tmp{os.getpid()}"
+    written = 0
+    writer = _open_writer(tmp_path, fmt, schema)
+    try:
+        for chunk in iter_chunks(table, columns, indices, chunk_size):
+            writer.write_table(chunk)
+            written += chunk.num_rows
+            if progress:
+                progress(written, total)
+    except BaseException:
+        writer.close()
+        os.remove(tmp_path)
+        raise
+    writer.close()
+    os.replace(tmp_path, output_path)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="将数据集中筛选后的行导出为 CSV / Parquet / JSONL")
+    parser.add_argument("--dataset_path", "-d", required=True, help="本地数据集路径")
+    parser.add_argument("--output", "-o", required=True, help="输出文件，格式由扩展名决定")
+    parser.add_argument("--format", "-f", choices=list(EXPORT_FORMATS), help="导出格式，默认由扩展名推断")
+    parser.add_argument("--split", default="train", help="数据集划分")
+    parser.add_argument("--columns", "-c", help="逗号分隔的列名，默认全部列")
+    parser.add_argument("--search", default="", help="在所有文本列中搜索的子串")
+    parser.add_argument("--sort_by", help="排序列")
+    parser.add_argument("--descending", action="store_true", help="降序排序")
+    parser.add_argument("--chunk_size", type=int, default=DEFAULT_CHUNK_SIZE, help="每块写出的行数")
+
+    args = parser.parse_args()
+
+    table = open_split_table(os.path.join(args.dataset_path, args.split))
+    indices = select_rows(table, args.search, args.sort_by, args.descending)
+    columns = args.columns.split(",") if args.columns else None
+    written = export_rows(table, args.output, args.format, columns, indices, args.chunk_size)
+    print(f"✅ 已导出 {written} 行到: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+"""
+Dataset Query
+对已保存数据集进行列裁剪和谓词下推查询，利用写入时记录的分片/批次 min/max 区域映射跳过无关数据
+"""
+
+import os
+import json
+import argparse
+import re
+import hashlib
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from typing import Dict, Any, List, Optional, Tuple, Iterator
+
+# 记录区域映射的列 (与转换器的数值列一致)
+ZONE_MAP_COLUMNS = ['Essay_id', 'Essay_score', 'Overall_score', 'Score_TR', 'Score_CC', 'Score_LR', 'Score_GRA']
+ZONE_MAP_FILE = "zone_maps.json"
+
+# 主键索引：按Essay_id排序的 (id, 分片序号, 分片内行号)，以内存映射方式读取
+ID_COLUMN = "Essay_id"
+ID_INDEX_FILE = "id_index.npy"
+ID_INDEX_DTYPE = np.dtype([("id", "<i8"), ("shard", "<i4"), ("row", "<i8")])
+
+OPERATORS = {
+    "==": pc.equal,
+    "!=": pc.not_equal,
+    "<": pc.less,
+    "<=": pc.less_equal,
+    ">": pc.greater,
+    ">=": pc.greater_equal,
+    "in": lambda column, values: pc.is_in(column, value_set=pa.array(values, type=column.type))
+}
+
+Predicate = Tuple[str, str, Any]
+
+
+def parse_predicate(text: str) -> Predicate:
+    """解析 "Essay_score>=7" 或 "Essay_id in 1,2,3" 形式的谓词"""
+    match = re.match(r"^\s*(\w+)\s+in\s+(.+)$", text)
+    if match:
+        return match.group(1), "in", [int(v) for v in match.group(2).split(",")]
+    match = re.match(r"^\s*(\w+)\s*(==|!=|<=|>=|<|>)\s*(-?\d+)\s*$", text)
+    if not match:
+        raise ValueError(f"无法解析谓词: {text}")
+    return match.group(1), match.group(2), int(match.group(3))
+
+
+def shard_files(split_path: str) -> List[str]:
+    """按 state.json 中的顺序列出分片文件"""
+    with open(os.path.join(split_path, "state.json"), 'r', encoding='utf-8') as f:
+        state = json.load(f)
+    return [item["filename"] for item in state["_data_files"]]
+
+
+def open_shard(path: str) -> pa.ipc.RecordBatchStreamReader:
+    """以内存映射方式打开分片，读取批次时只访问用到的列缓冲区"""
+    return pa.ipc.open_stream(pa.memory_map(path, 'r'))
+
+
+def open_split_table(split_path: str) -> pa.Table:
+    """以内存映射方式打开一个划分的全部分片，不复制数据"""
+    tables = [open_shard(os.path.join(split_path, filename)).read_all()
+              for filename in shard_files(split_path)]
+    return pa.concat_tables(tables)
+
+
+def take_rows(batches: List[pa.RecordBatch], offsets: np.ndarray, indices: np.ndarray,
+              schema: pa.Schema) -> pa.Table:
+    """按全局行号取行，结果保持 indices 的顺序
+
+    先按所在批次分组取行再恢复原顺序；直接对分块列 take 会先拼接整列字符串。
+    offsets 为各批次的起始行号 (长度为批次数+1)。
+    """
+    if len(indices) == 0:
+        return schema.empty_table()
+    batch_ids = np.searchsorted(offsets, indices, side="right") - 1
+    order = np.argsort(batch_ids, kind="stable")
+    grouped_ids = batch_ids[order]
+    starts = np.flatnonzero(np.r_[True, grouped_ids[1:] != grouped_ids[:-1]])
+    ends = np.r_[starts[1:], len(order)]
+    pieces = []
+    for start, end in zip(starts, ends):
+        b = grouped_ids[start]
+        pieces.append(batches[b].take(pa.array(indices[order[start:end]] - offsets[b])))
+    grouped = pa.Table.from_batches(pieces, schema).combine_chunks()
+    return grouped.take(np.argsort(order))
+
+
+def batch_offsets(batches: List[pa.RecordBatch]) -> np.ndarray:
+    return np.cumsum([0] + [batch.num_rows for batch in batches])
+
+
+def dictionary_encode_shards(split_path: str, columns: List[str]):
+    """将分片中的指定字符串列改写为字典编码，所有批次共享同一字典，批次划分保持不变"""
+    for filename in shard_files(split_path):
+        path = os.path.join(split_path, filename)
+        table = open_shard(path).read_all()
+        for name in columns:
+            if name in table.column_names and not pa.types.is_dictionary(table.schema.field(name).type):
+                index = table.schema.get_field_index(name)
+                table = table.set_column(index, table.schema.field(name).name,
+                                         pc.dictionary_encode(table.column(name)))
+        table = table.unify_dictionaries()
+
+        tmp_path = f"{path}.tmp"
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                for batch in table.to_batches():
+                    writer.write_batch(batch)
+        os.replace(tmp_path, path)
+
+
+def text_contains(column, term: str, ignore_case: bool = True):
+    """子串匹配；字典编码列只匹配字典值再按索引展开"""
+    if isinstance(column, pa.ChunkedArray):
+        return pa.chunked_array([text_contains(chunk, term, ignore_case) for chunk in column.chunks],
+                                type=pa.bool_())
+    if pa.types.is_dictionary(column.type):
+        matched = pc.match_substring(column.dictionary, term, ignore_case=ignore_case)
+        return pc.take(matched, column.indices)
+    return pc.match_substring(column, term, ignore_case=ignore_case)
+
+
+def dataset_fingerprint(dataset_path: str) -> str:
+    """由各划分 state.json 中的指纹组合得到数据集指纹，数据集重新生成后会改变"""
+    with open(os.path.join(dataset_path, "dataset_dict.json"), 'r', encoding='utf-8') as f:
+        splits = json.load(f)["splits"]
+    parts = []
+    for split in splits:
+        with open(os.path.join(dataset_path, split, "state.json"), 'r', encoding='utf-8') as f:
+            parts.append(f"{split}:{json.load(f)['_fingerprint']}")
+    return hashlib.blake2b(",".join(parts).encode(), digest_size=8).hexdigest()
+
+
+def _column_range(batch: pa.RecordBatch, columns: List[str]) -> Dict[str, Dict[str, Any]]:
+    stats = {}
+    for name in columns:
+        min_max = pc.min_max(batch.column(name))
+        stats[name] = {"min": min_max["min"].as_py(), "max": min_max["max"].as_py()}
+    return stats
+
+
+def _merge_ranges(ranges: List[Dict[str, Dict[str, Any]]]) -> Dict[str, Dict[str, Any]]:
+    merged = {}
+    for item in ranges:
+        for name, value in item.items():
+            if value["min"] is None:
+                continue
+            if name not in merged:
+                merged[name] = dict(value)
+            else:
+                merged[name]["min"] = min(merged[name]["min"], value["min"])
+                merged[name]["max"] = max(merged[name]["max"], value["max"])
+    return merged
+
+
+def write_zone_maps(split_path: str) -> str:
+    """为一个划分的每个分片和批次记录数值列的 min/max，保存为 zone_maps.json"""
+    shards = []
+    for filename in shard_files(split_path):
+        reader = open_shard(os.path.join(split_path, filename))
+        columns = [name for name in ZONE_MAP_COLUMNS if name in reader.schema.names]
+        batches, offset = [], 0
+        for batch in reader:
+            if batch.num_rows == 0:
+                continue
+            batches.append({
+                "offset": offset,
+                "num_rows": batch.num_rows,
+                "columns": _column_range(batch, columns)
+            })
+            offset += batch.num_rows
+        shards.append({
+            "filename": filename,
+            "num_rows": offset,
+            "columns": _merge_ranges([b["columns"] for b in batches]),
+            "batches": batches
+        })
+
+    zone_map_path = os.path.join(split_path, ZONE_MAP_FILE)
+    with open(zone_map_path, 'w', encoding='utf-8') as f:
+        json.dump({"shards": shards}, f, ensure_ascii=False)
+    return zone_map_path
+
+
+def has_id_column(split_path: str) -> bool:
+    """划分的分片中是否有Essay_id列"""
+    shards = shard_files(split_path)
+    return bool(shards) and ID_COLUMN in open_shard(os.path.join(split_path, shards[0])).schema.names
+
+
+def _build_id_index(split_path: str) -> np.ndarray:
+    parts = []
+    for shard, filename in enumerate(shard_files(split_path)):
+        table = open_shard(os.path.join(split_path, filename)).read_all()
+        if ID_COLUMN not in table.column_names:
+            return np.empty(0, dtype=ID_INDEX_DTYPE)
+        ids = table.column(ID_COLUMN).to_numpy()
+        part = np.empty(len(ids), dtype=ID_INDEX_DTYPE)
+        part["id"] = ids
+        part["shard"] = shard
+        part["row"] = np.arange(len(ids))
+        parts.append(part)
+    entries = np.concatenate(parts) if parts else np.empty(0, dtype=ID_INDEX_DTYPE)
+    # 稳定排序，重复ID按 (分片, 行) 顺序排列，查找时返回第一次出现的行
+    return entries[np.argsort(entries["id"], kind="stable")]
+
+
+def duplicate_ids(ids: np.ndarray) -> np.ndarray:
+    """有序ID数组中重复出现的ID"""
+    return np.unique(ids[1:][ids[1:] == ids[:-1]])
+
+
+def write_id_index(split_path: str) -> np.ndarray:
+    """为一个划分写入Essay_id主键索引，返回重复的ID；没有Essay_id列时不写索引"""
+    if not has_id_column(split_path):
+        return np.empty(0, dtype=np.int64)
+    entries = _build_id_index(split_path)
+    index_path = os.path.join(split_path, ID_INDEX_FILE)
+    tmp_path = f"{index_path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, entries)
+    os.replace(tmp_path, index_path)
+    return duplicate_ids(entries["id"])
+
+
+def finalize_split(split_path: str, dictionary_columns: Optional[List[str]] = None) -> np.ndarray:
+    """save_to_disk 之后的后处理：字典编码、写入区间映射和主键索引，返回重复的ID"""
+    if dictionary_columns:
+        dictionary_encode_shards(split_path, dictionary_columns)
+    # 记录每个分片/批次数值列的 min/max，供查询时跳过无关数据
+    write_zone_maps(split_path)
+    # Essay_id → (分片, 行) 主键索引，供按ID直接读取
+    return write_id_index(split_path)
+
+
+def zone_may_match(stats: Dict[str, Dict[str, Any]], predicates: List[Predicate]) -> bool:
+    """根据 min/max 判断区域内是否可能存在满足所有谓词的行"""
+    for column, op, value in predicates:
+        if column not in stats or stats[column]["min"] is None:
+            continue
+        low, high = stats[column]["min"], stats[column]["max"]
+        if op == "==" and not low <= value <= high:
+            return False
+        if op == "!=" and low == high == value:
+            return False
+        if op == "<" and not low < value:
+            return False
+        if op == "<=" and not low <= value:
+            return False
+        if op == ">" and not high > value:
+            return False
+        if op == ">=" and not high >= value:
+            return False
+        if op == "in" and not any(low <= v <= high for v in value):
+            return False
+    return True
+
+
+class IdIndex:
+    """Essay_id 主键索引，对内存映射的有序ID数组二分查找，单个和批量查找都不扫描数据"""
+
+    def __init__(self, split_path: str):
+        self.split_path = split_path
+        self.shards = shard_files(split_path)
+        tables = [open_shard(os.path.join(split_path, filename)).read_all() for filename in self.shards]
+        self.shard_offsets = np.cumsum([0] + [table.num_rows for table in tables])
+        self.table = pa.concat_tables(tables)
+        self.batches = self.table.to_batches()
+        self.offsets = batch_offsets(self.batches)
+
+        index_path = os.path.join(split_path, ID_INDEX_FILE)
+        entries = np.load(index_path, mmap_mode='r') if os.path.exists(index_path) else None
+        if ID_COLUMN not in self.table.column_names:
+            # 没有Essay_id列的数据集使用空索引，所有查找都返回未找到
+            entries = np.empty(0, dtype=ID_INDEX_DTYPE)
+        elif entries is None or len(entries) != self.table.num_rows:
+            # 旧数据集没有索引 (或索引与数据不一致) 时在内存中重建
+            entries = _build_id_index(split_path)
+        self.entries = entries
+        self.ids = entries["id"]
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def duplicates(self) -> np.ndarray:
+        return duplicate_ids(np.asarray(self.ids))
+
+    def positions(self, essay_ids) -> np.ndarray:
+        """返回每个ID在整个划分中的行号，不存在的ID为 -1"""
+        essay_ids = np.atleast_1d(np.asarray(essay_ids, dtype=np.int64))
+        slots = np.searchsorted(self.ids, essay_ids, side="left")
+        found = slots < len(self.ids)
+        found[found] = self.ids[slots[found]] == essay_ids[found]
+        positions = np.full(len(essay_ids), -1, dtype=np.int64)
+        matched = self.entries[slots[found]]
+        positions[found] = self.shard_offsets[matched["shard"]] + matched["row"]
+        return positions
+
+    def fetch(self, essay_ids, columns: Optional[List[str]] = None) -> pa.Table:
+        """按请求顺序返回这些ID对应的行，不存在的ID被跳过"""
+        positions = self.positions(essay_ids)
+        positions = positions[positions >= 0]
+        if columns:
+            batches = [batch.select(columns) for batch in self.batches]
+            schema = self.table.schema.empty_table().select(columns).schema
+        else:
+            batches, schema = self.batches, self.table.schema
+        return take_rows(batches, self.offsets, positions, schema)
+
+    def get(self, essay_id: int, columns: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """单个ID直接从所在批次切出一行"""
+        position = self.positions([essay_id])[0]
+        if position < 0:
+            return None
+        b = np.searchsorted(self.offsets, position, side="right") - 1
+        row = self.batches[b].slice(position - self.offsets[b], 1)
+        return (row.select(columns) if columns else row).to_pylist()[0]
+
+
+class DatasetQuery:
+    def __init__(self, dataset_path: str):
+        self.dataset_path = dataset_path
+        self.stats = {}
+
+    def split_path(self, split: str) -> str:
+        return os.path.join(self.dataset_path, split)
+
+    def load_zone_maps(self, split: str) -> Optional[Dict[str, Any]]:
+        """加载区域映射；旧数据集没有该文件时返回None"""
+        path = os.path.join(self.split_path(split), ZONE_MAP_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def schema(self, split: str = "train") -> pa.Schema:
+        split_path = self.split_path(split)
+        return open_shard(os.path.join(split_path, shard_files(split_path)[0])).schema
+
+    def _validate(self, schema: pa.Schema, columns: List[str], predicates: List[Predicate]):
+        for name in columns:
+            if name not in schema.names:
+                raise ValueError(f"列不存在: {name}")
+        for column, op, _ in predicates:
+            if column not in ZONE_MAP_COLUMNS:
+                raise ValueError(f"只支持对数值列和Essay_id设置谓词: {column}")
+            if op not in OPERATORS:
+                raise ValueError(f"不支持的运算符: {op}")
+
+    def iter_batches(self, columns: Optional[List[str]] = None,
+                     predicates: Optional[List[Predicate]] = None,
+                     split: str = "train") -> Iterator[pa.RecordBatch]:
+        """逐批返回满足谓词的行，只包含请求的列"""
+        predicates = predicates or []
+        split_path = self.split_path(split)
+        schema = self.schema(split)
+        selected = columns or schema.names
+        self._validate(schema, selected, predicates)
+        needed = list(dict.fromkeys(selected + [p[0] for p in predicates]))
+        zone_maps = self.load_zone_maps(split)
+        shard_maps = {shard["filename"]: shard for shard in zone_maps["shards"]} if zone_maps else {}
+        self.stats = {"shards_total": 0, "shards_skipped": 0, "batches_total": 0,
+                      "batches_skipped": 0, "rows_scanned": 0, "rows_matched": 0, "bytes_scanned": 0}
+
+        for filename in shard_files(split_path):
+            self.stats["shards_total"] += 1
+            shard_map = shard_maps.get(filename)
+            if shard_map:
+                self.stats["batches_total"] += len(shard_map["batches"])
+                if not zone_may_match(shard_map["columns"], predicates):
+                    self.stats["shards_skipped"] += 1
+                    self.stats["batches_skipped"] += len(shard_map["batches"])
+                    continue
+            batch_maps = iter(shard_map["batches"]) if shard_map else None
+
+            reader = open_shard(os.path.join(split_path, filename))
+            for batch in reader:
+                if batch.num_rows == 0:
+                    continue
+                if batch_maps is not None:
+                    if not zone_may_match(next(batch_maps)["columns"], predicates):
+                        self.stats["batches_skipped"] += 1
+                        continue
+                else:
+                    self.stats["batches_total"] += 1
+
+                projected = batch.select(needed)
+                self.stats["rows_scanned"] += projected.num_rows
+                self.stats["bytes_scanned"] += projected.nbytes
+                if predicates:
+                    mask = None
+                    for column, op, value in predicates:
+                        condition = OPERATORS[op](projected.column(column), value)
+                        mask = condition if mask is None else pc.and_(mask, condition)
+                    projected = projected.filter(mask)
+                if projected.num_rows == 0:
+                    continue
+                self.stats["rows_matched"] += projected.num_rows
+                yield projected.select(selected)
+
+    def select(self, columns: Optional[List[str]] = None,
+               predicates: Optional[List[Predicate]] = None,
+               split: str = "train") -> pa.Table:
+        """查询并返回Arrow表"""
+        batches = list(self.iter_batches(columns, predicates, split))
+        if batches:
+            return pa.Table.from_batches(batches)
+        schema = self.schema(split)
+        return schema.empty_table().select(columns or schema.names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按列和谓词查询本地数据集")
+    parser.add_argument("--dataset_path", "-d", required=True, help="本地数据集路径")
+    parser.add_argument("--split", default="train", help="数据集划分")
+    parser.add_argument("--columns", "-c", help="逗号分隔的列名，默认全部列")
+    parser.add_argument("--where", "-w", action="append", default=[],
+                        help="谓词，可重复，例如 \"Essay_score>=7\" 或 \"Essay_id in 1,2,3\"")
+    parser.add_argument("--limit", type=int, default=20, help="显示的最大行数")
+
+    args = parser.parse_args()
+
+    query = DatasetQuery(args.dataset_path)
+    columns = args.columns.split(",") if args.columns else None
+    table = query.select(columns, [parse_predicate(text) for text in args.where], args.split)
+
+    print(table.slice(0, args.limit).to_pandas())
+    print(f"\n匹配 {table.num_rows} 行")
+    print(f"查询统计: {query.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,12 +8,62 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from datasets import load_from_disk
+from dataset_query import IdIndex, ID_COLUMN, dataset_fingerprint
+from prompt_stats import load_prompt_stats, GROUP_COLUMN
+from dataset_export import export_rows, EXPORT_FORMATS
+from build_publisher import SnapshotLease, build_of, collect_builds
 import json
 import os
 from typing import Dict, Any, List
 import numpy as np
 
+TEXT_DTYPES = ['object', 'string', 'category']
+EXPORT_DIR = "exports"
+# 超过该大小的导出文件只保存在磁盘上，不经浏览器下载 (下载时Streamlit会把文件读入内存)
+DOWNLOAD_MAX_BYTES = 200 * 1024 * 1024
+
+
+def text_lengths(series: pd.Series) -> pd.Series:
+    """文本长度；字典编码 (categorical) 列只计算每个字典值一次"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        category_lengths = series.cat.categories.astype(str).str.len().to_numpy()
+        return pd.Series(category_lengths[series.cat.codes.to_numpy()], index=series.index)
+    return series.astype(str).str.len()
+
+
+def sort_key(series: pd.Series) -> pd.Series:
+    """排序键；字典编码列按字典值而不是字典顺序排序"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.reorder_categories(series.cat.categories.sort_values()).cat.codes
+    return series
+
+
+def read_snapshot(snapshot_path: str) -> Dict[str, Any]:
+    """读取一个构建：持有其共享锁，以内存映射方式打开Arrow表"""
+    lease = SnapshotLease(snapshot_path)
+    # 字典编码列转换为pandas categorical而不是逐行字符串
+    index = IdIndex(os.path.join(snapshot_path, "train"))
+    config = None
+    config_path = os.path.join(os.path.dirname(snapshot_path), "dataset_info.json")
+    if os.path.exists(config_path):
+        with open(config_path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    return {"lease": lease, "index": index, "df": index.table.to_pandas(), "config": config}
+
+
+# 只缓存最新的构建：发布新构建后旧条目被淘汰，其共享锁随之释放，旧构建即可回收；
+# 指纹也是缓存键的一部分，就地重写的数据集 (非发布器输出) 同样会重新加载
+@st.cache_resource(max_entries=1, show_spinner="正在加载数据集...")
+def cached_snapshot(snapshot_path: str, fingerprint: str) -> Dict[str, Any]:
+    return read_snapshot(snapshot_path)
+
+
+@st.cache_resource(show_spinner="正在按题目聚合评分...")
+def cached_prompt_stats(dataset_path: str, fingerprint: str):
+    """按数据集指纹缓存分组聚合结果，页面重新运行时不再重复计算"""
+    return load_prompt_stats(dataset_path)
+
+
 # 设置页面配置
 st.set_page_config(
     page_title="Dataset Viewer",
@@ -25,21 +75,23 @@ st.set_page_config(
 class DatasetViewer:
     def __init__(self, dataset_path: str):
         self.dataset_path = dataset_path
+        self.snapshot_path = None
+        self.lease = None
         self.dataset = None
+        self.index = None
         self.df = None
         self.config = None
         
-    def load_dataset(self):
-        """加载数据集"""
+    def load_dataset(self, cached: bool = False):
+        """加载数据集；dataset_path 为转换器发布的链接时，读取其当前指向的构建"""
         try:
-            self.dataset = load_from_disk(self.dataset_path)
-            self.df = self.dataset["train"].to_pandas()
-            
-            # 加载配置文件
-            config_path = os.path.join(os.path.dirname(self.dataset_path), "dataset_info.json")
-            if os.path.exists(config_path):
-                with open(config_path, 'r', encoding='utf-8') as f:
-                    self.config = json.load(f)
+            self.snapshot_path = os.path.realpath(self.dataset_path)
+            snapshot = cached_snapshot(self.snapshot_path, dataset_fingerprint(self.snapshot_path)) if cached else read_snapshot(self.snapshot_path)
+            self.lease = snapshot["lease"]
+            self.index = snapshot["index"]
+            self.dataset = self.index.table
+            self.df = snapshot["df"]
+            self.config = snapshot["config"]
             
             return True
         except Exception as e:
@@ -54,6 +106,9 @@ class DatasetViewer:
             st.markdown(f"**Dataset:** {self.config.get('dataset_name', 'Unknown')}")
             st.markdown(f"**Version:** {self.config.get('version', 'Unknown')}")
             st.markdown(f"**Description:** {self.config.get('description', 'No description')}")
+        build_dir = build_of(self.snapshot_path)
+        if build_dir:
+            st.markdown(f"**Build:** `{os.path.basename(build_dir)}`")
         
         col1, col2, col3, col4 = st.columns(4)
         with col1:
@@ -77,7 +132,7 @@ class DatasetViewer:
             return self.df
         
         # 在所有文本列中搜索
-        text_columns = self.df.select_dtypes(include=['object', 'string']).columns
+        text_columns = self.df.select_dtypes(include=TEXT_DTYPES).columns
         mask = pd.Series([False] * len(self.df))
         
         for col in text_columns:
@@ -85,6 +140,45 @@ class DatasetViewer:
         
         return self.df[mask]
     
+    def render_sort_controls(self):
+        """渲染排序选项"""
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            sort_by = st.selectbox("Sort by", ["(none)"] + list(self.df.columns), key="sort_by")
+        with col2:
+            descending = st.checkbox("Descending", key="sort_descending")
+        return (None if sort_by == "(none)" else sort_by), descending
+    
+    def sort_data(self, filtered_df: pd.DataFrame, sort_by, descending: bool):
+        """按指定列排序，保持原行号作为索引"""
+        if not sort_by:
+            return filtered_df
+        return filtered_df.sort_values(sort_by, ascending=not descending, kind='stable', key=sort_key)
+    
+    def render_essay_lookup(self):
+        """按Essay_id查找作文，使用主键索引而不是扫描整个表"""
+        if ID_COLUMN not in self.df.columns:
+            return
+        with st.expander("🔎 Lookup by Essay_id"):
+            text = st.text_input("Essay_id", placeholder="例如 12 或 12,15,40", key="essay_id_lookup")
+            if not text:
+                return
+            try:
+                essay_ids = [int(v) for v in text.replace("，", ",").split(",") if v.strip()]
+            except ValueError:
+                st.error("Essay_id 必须是整数，多个ID用逗号分隔")
+                return
+            
+            positions = self.index.positions(essay_ids)
+            missing = [essay_id for essay_id, position in zip(essay_ids, positions) if position < 0]
+            if missing:
+                st.warning(f"未找到: {missing}")
+            rows = self.df.iloc[positions[positions >= 0]]
+            if len(rows) == 1:
+                st.json({k: (v.item() if hasattr(v, 'item') else v) for k, v in rows.iloc[0].items()})
+            elif len(rows) > 1:
+                st.dataframe(rows, width='stretch')
+    
     def render_column_info(self):
         """渲染列信息"""
         st.markdown("### 📋 Column Information")
@@ -114,7 +208,7 @@ class DatasetViewer:
                 st.plotly_chart(fig, use_container_width=True)
             else:
                 # 文本列的长度分布
-                lengths = self.df[col].astype(str).str.len()
+                lengths = text_lengths(self.df[col])
                 fig = px.histogram(
                     x=lengths,
                     title=f"{col} Length Distribution",
@@ -166,33 +260,84 @@ class DatasetViewer:
             if st.button("Next ▶", disabled=(page == total_pages)):
                 st.rerun()
     
-    def render_statistics(self):
-        """渲染统计信息"""
-        st.markdown("### 📈 Dataset Statistics")
-        
-        # 数值列统计
+    def render_export(self, filtered_df: pd.DataFrame):
+        """将当前筛选和排序后的行流式导出为文件"""
+        with st.expander("⬇️ Export"):
+            columns = st.multiselect("Columns", list(self.df.columns), default=list(self.df.columns),
+                                     key="export_columns")
+            fmt = st.selectbox("Format", list(EXPORT_FORMATS), key="export_format")
+            
+            if st.button(f"Export {len(filtered_df)} rows", disabled=not columns):
+                os.makedirs(EXPORT_DIR, exist_ok=True)
+                name = os.path.basename(os.path.normpath(os.path.dirname(self.dataset_path))) or "dataset"
+                output_path = os.path.join(EXPORT_DIR, f"{name}-{pd.Timestamp.now():%Y%m%d-%H%M%S}.{fmt}")
+                progress = st.progress(0.0)
+                
+                # 只从内存映射的Arrow表读取选中的列；DataFrame索引即原始行号
+                written = export_rows(
+                    self.dataset,
+                    output_path,
+                    fmt,
+                    columns,
+                    filtered_df.index.to_numpy(),
+                    progress=lambda done, total: progress.progress(done / total if total else 1.0)
+                )
+                progress.progress(1.0)
+                st.session_state.export_path = output_path
+                st.success(f"已导出 {written} 行到: {output_path}")
+            
+            output_path = st.session_state.get("export_path")
+            if output_path and os.path.exists(output_path):
+                if os.path.getsize(output_path) <= DOWNLOAD_MAX_BYTES:
+                    st.download_button(
+                        f"Download {os.path.basename(output_path)}",
+                        data=lambda: open(output_path, 'rb'),
+                        file_name=os.path.basename(output_path),
+                        mime=EXPORT_FORMATS[output_path.rsplit(".", 1)[1]],
+                        on_click="ignore"
+                    )
+                else:
+                    st.info(f"文件较大，请直接从磁盘获取: {os.path.abspath(output_path)}")
+    
+    def compute_statistics(self):
+        """计算数值列和文本列的统计信息"""
+        numeric_stats = None
         numeric_cols = self.df.select_dtypes(include=[np.number]).columns
         if len(numeric_cols) > 0:
-            st.markdown("#### Numerical Statistics")
-            st.dataframe(self.df[numeric_cols].describe(), width='stretch')
+            numeric_stats = self.df[numeric_cols].describe()
         
-        # 文本列统计
-        text_cols = self.df.select_dtypes(include=['object', 'string']).columns
+        text_stats = None
+        text_cols = self.df.select_dtypes(include=TEXT_DTYPES).columns
         if len(text_cols) > 0:
-            st.markdown("#### Text Statistics")
-            text_stats = []
+            rows = []
             for col in text_cols:
-                lengths = self.df[col].astype(str).str.len()
-                text_stats.append({
+                lengths = text_lengths(self.df[col])
+                rows.append({
                     'Column': col,
                     'Min Length': lengths.min(),
                     'Max Length': lengths.max(),
                     'Avg Length': lengths.mean(),
                     'Unique Values': self.df[col].nunique()
                 })
-            
-            text_df = pd.DataFrame(text_stats)
-            st.dataframe(text_df, width='stretch')
+            text_stats = pd.DataFrame(rows)
+        
+        return numeric_stats, text_stats
+    
+    def render_statistics(self):
+        """渲染统计信息"""
+        st.markdown("### 📈 Dataset Statistics")
+        
+        numeric_stats, text_stats = self.compute_statistics()
+        
+        # 数值列统计
+        if numeric_stats is not None:
+            st.markdown("#### Numerical Statistics")
+            st.dataframe(numeric_stats, width='stretch')
+        
+        # 文本列统计
+        if text_stats is not None:
+            st.markdown("#### Text Statistics")
+            st.dataframe(text_stats, width='stretch')
     
     def render_visualizations(self):
         """渲染可视化图表"""
@@ -233,25 +378,82 @@ class DatasetViewer:
             )
             st.plotly_chart(fig, use_container_width=True)
     
+    def render_prompt_stats(self):
+        """渲染按作文题目分组的统计"""
+        st.markdown("### 🏷️ Prompt Statistics")
+        
+        aggregator = cached_prompt_stats(self.snapshot_path, dataset_fingerprint(self.snapshot_path))
+        if not aggregator.groups:
+            st.info("数据集中没有作文题目")
+            return
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            score_col = st.selectbox("Score", aggregator.score_columns, key="prompt_score")
+        with col2:
+            top_n = st.number_input("Top prompts by count", min_value=1,
+                                    max_value=len(aggregator.groups), value=min(20, len(aggregator.groups)))
+        
+        summary = aggregator.summary()
+        st.dataframe(summary, width='stretch', height=400)
+        
+        top = summary.head(int(top_n))
+        # 截断后的题目可能重名，加上序号区分
+        labels = [f"{i + 1}. {prompt[:60]}" for i, prompt in enumerate(top[GROUP_COLUMN])]
+        
+        fig = px.bar(
+            x=top[f"{score_col}_mean"],
+            y=labels,
+            orientation='h',
+            title=f"Mean {score_col} per Prompt",
+            labels={'x': f"Mean {score_col}", 'y': 'Prompt'},
+            hover_data={'count': top['count']}
+        )
+        fig.update_layout(height=max(300, 25 * len(top)), yaxis={'autorange': 'reversed'})
+        st.plotly_chart(fig, use_container_width=True)
+        
+        histogram = aggregator.histogram(score_col).loc[top[GROUP_COLUMN]]
+        fig = px.imshow(
+            histogram.to_numpy(),
+            x=[str(band) for band in histogram.columns],
+            y=labels,
+            text_auto=True,
+            aspect="auto",
+            title=f"{score_col} Band Histogram per Prompt",
+            labels={'x': 'Band', 'y': 'Prompt', 'color': 'Count'}
+        )
+        fig.update_layout(height=max(300, 25 * len(top)))
+        st.plotly_chart(fig, use_container_width=True)
+    
     def run(self):
         """运行查看器"""
-        if not self.load_dataset():
+        if not self.load_dataset(cached=True):
             return
         
+        # 转换器发布了新构建：本会话已切换，尝试回收不再被使用的旧构建
+        previous = st.session_state.get("snapshot_path")
+        if previous and previous != self.snapshot_path:
+            st.toast(f"已切换到新发布的数据集: {os.path.basename(os.path.dirname(self.snapshot_path))}")
+            collect_builds(previous)
+        st.session_state.snapshot_path = self.snapshot_path
+        
         # 渲染头部
         self.render_header()
         
         # 渲染搜索栏
         search_term = self.render_search_bar()
         
-        # 过滤数据
-        filtered_df = self.filter_data(search_term)
+        # 过滤和排序数据
+        sort_by, descending = self.render_sort_controls()
+        filtered_df = self.sort_data(self.filter_data(search_term), sort_by, descending)
         
         # 创建标签页
-        tab1, tab2, tab3, tab4 = st.tabs(["📊 Data Table", "📋 Column Info", "📈 Statistics", "📊 Visualizations"])
+        tab1, tab2, tab3, tab4, tab5 = st.tabs(["📊 Data Table", "📋 Column Info", "📈 Statistics", "📊 Visualizations", "🏷️ Prompts"])
         
         with tab1:
+            self.render_essay_lookup()
             self.render_data_table(filtered_df)
+            self.render_export(filtered_df)
         
         with tab2:
             self.render_column_info()
@@ -261,6 +463,9 @@ class DatasetViewer:
         
         with tab4:
             self.render_visualizations()
+        
+        with tab5:
+            self.render_prompt_stats()
 
 def main():
     st.sidebar.title("Dataset Viewer")
@@ -272,12 +477,17 @@ def main():
         help="输入Hugging Face数据集的路径"
     )
     
+    # 记住已加载的路径，页面上的其他操作触发重新运行时不会丢失数据集
     if st.sidebar.button("Load Dataset"):
-        if os.path.exists(dataset_path):
-            viewer = DatasetViewer(dataset_path)
+        st.session_state.dataset_path = dataset_path
+    
+    loaded_path = st.session_state.get("dataset_path")
+    if loaded_path:
+        if os.path.exists(loaded_path):
+            viewer = DatasetViewer(loaded_path)
             viewer.run()
         else:
-            st.error(f"数据集路径不存在: {dataset_path}")
+            st.error(f"数据集路径不存在: {loaded_path}")
     
     # 侧边栏信息
     st.sidebar.markdown("---")
@@ -293,9 +503,11 @@ def main():
     st.sidebar.markdown("""
     - 🔍 实时搜索过滤
     - 📊 数据表格浏览
+    - ⬇️ 导出筛选结果 (CSV/Parquet/JSONL)
     - 📋 列信息分析
     - 📈 统计信息展示
     - 📊 可视化图表
+    - 🏷️ 按题目统计评分
     - 📄 分页浏览
     """)
 
@@ -5,16 +5,77 @@ Excel to Hugging Face Dataset Converter
 """
 
 import pandas as pd
+import numpy as np
 import json
 import os
 from datasets import Dataset, DatasetDict
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 import argparse
+from stage_profiler import StageProfiler, directory_size
+from dataset_query import finalize_split, duplicate_ids
+from snapshot_store import SnapshotStore
+from build_publisher import BuildPublisher
+
+SPLIT_DESCRIPTIONS = {
+    "train": "训练集",
+    "validation": "验证集",
+    "test": "测试集"
+}
+
+# 不同取值数 / 行数不超过该比例的文本列以字典编码保存
+DICTIONARY_MAX_RATIO = 0.5
+
+
+def parse_split_ratios(spec: str) -> Dict[str, float]:
+    """解析 "train=0.8,validation=0.1,test=0.1" 形式的划分比例"""
+    ratios = {}
+    for item in spec.split(","):
+        name, _, value = item.partition("=")
+        name = name.strip()
+        if not name or not value:
+            raise ValueError(f"无效的划分比例: {item}")
+        ratios[name] = float(value)
+    
+    total = sum(ratios.values())
+    if total <= 0 or any(v < 0 for v in ratios.values()):
+        raise ValueError(f"划分比例必须为非负数且总和大于0: {spec}")
+    return {name: value / total for name, value in ratios.items()}
+
+
+def stable_hash_unit(essay_ids) -> np.ndarray:
+    """将Essay_id映射到[0, 1)区间的稳定哈希值 (splitmix64)，与进程和数据顺序无关"""
+    x = np.asarray(essay_ids, dtype=np.int64).astype(np.uint64)
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    x = x ^ (x >> np.uint64(31))
+    return (x >> np.uint64(11)).astype(np.float64) / float(1 << 53)
+
+
+def score_band(scores) -> np.ndarray:
+    """将Overall_score映射到0-9的整数分数段"""
+    return np.clip(np.asarray(scores, dtype=np.int64), 0, 9)
+
 
 class ExcelToHuggingFaceConverter:
-    def __init__(self, excel_file: str, output_dir: str = "huggingface_dataset"):
+    def __init__(self, excel_file: str, output_dir: str = "huggingface_dataset",
+                 split_ratios: Optional[Dict[str, float]] = None,
+                 stratify: bool = False, chunk_size: int = 10000,
+                 profiler: Optional[StageProfiler] = None, version: str = "1.0.0",
+                 dictionary_ratio: float = DICTIONARY_MAX_RATIO, reject_duplicate_ids: bool = False):
         self.excel_file = excel_file
         self.output_dir = output_dir
+        self.split_ratios = split_ratios
+        self.stratify = stratify
+        self.chunk_size = chunk_size
+        self.version = version
+        self.dictionary_ratio = dictionary_ratio
+        self.dictionary_columns = []
+        self.reject_duplicate_ids = reject_duplicate_ids
+        self.duplicate_ids = []
+        self.split_counts = None
+        self.build_dir = None
+        self.profiler = profiler or StageProfiler(enabled=False)
         self.df = None
         
     def load_excel(self) -> pd.DataFrame:
@@ -50,7 +111,7 @@ class ExcelToHuggingFaceConverter:
         """创建数据集配置文件"""
         config = {
             "dataset_name": "essay_feedback_dataset",
-            "version": "1.0.0",
+            "version": self.version,
             "description": "英语作文评分和反馈数据集",
             "language": "zh",
             "task_categories": ["text-classification", "text-generation"],
@@ -71,12 +132,32 @@ class ExcelToHuggingFaceConverter:
                 "Suggestion for improvement": {"dtype": "string", "description": "改进建议"}
             },
             "splits": {
-                "train": {
-                    "num_examples": len(self.df),
-                    "description": "训练集"
+                name: {
+                    "num_examples": count,
+                    "description": SPLIT_DESCRIPTIONS.get(name, name)
                 }
+                for name, count in (self.split_counts or {"train": len(self.df)}).items()
             }
         }
+        
+        for col in self.dictionary_columns:
+            config["features"][col]["encoding"] = "dictionary"
+        
+        if self.df is not None and 'Essay_id' in self.df.columns:
+            config["primary_key"] = {
+                "column": "Essay_id",
+                "index": "id_index.npy",
+                "unique": not self.duplicate_ids,
+                "duplicate_ids": len(self.duplicate_ids)
+            }
+        
+        if self.split_ratios:
+            config["split_strategy"] = {
+                "method": "hash",
+                "key": "Essay_id",
+                "ratios": self.split_ratios,
+                "stratify_by": "Overall_score" if self.stratify else None
+            }
         return config
     
     def convert_to_huggingface(self) -> Dataset:
@@ -95,12 +176,25 @@ class ExcelToHuggingFaceConverter:
             if col in df_clean.columns:
                 df_clean[col] = pd.to_numeric(df_clean[col], errors='coerce').fillna(0).astype('int64')
         
+        # Essay_id 是主键，缺失值被填为0后也可能重复
+        if 'Essay_id' in df_clean.columns:
+            self.check_duplicate_ids(df_clean['Essay_id'].to_numpy())
+        
         # 对于文本列，用空字符串填充缺失值
         text_columns = ['Essay_Prompt', 'Essay', 'Feedback_TR', 'Feedback_CC', 'Feedback_LR', 'Feedback_GRA', 'Suggestion for improvement']
         for col in text_columns:
             if col in df_clean.columns:
                 df_clean[col] = df_clean[col].fillna("").astype('string')
         
+        # 取值重复较多的文本列 (如 Essay_Prompt) 保存时使用字典编码
+        self.dictionary_columns = [
+            col for col in text_columns
+            if col in df_clean.columns and len(df_clean) > 0
+            and df_clean[col].nunique() / len(df_clean) <= self.dictionary_ratio
+        ]
+        if self.dictionary_columns:
+            print(f"字典编码列: {self.dictionary_columns}")
+        
         # 转换为字典列表
         data_dict = df_clean.to_dict('records')
         
@@ -110,34 +204,102 @@ class ExcelToHuggingFaceConverter:
         print(f"成功创建Dataset，包含 {len(dataset)} 个样本")
         return dataset
     
+    def check_duplicate_ids(self, essay_ids: np.ndarray):
+        """检查Essay_id是否唯一，重复时报告或拒绝转换"""
+        self.duplicate_ids = duplicate_ids(np.sort(essay_ids)).tolist()
+        if not self.duplicate_ids:
+            return
+        sample = ", ".join(str(i) for i in self.duplicate_ids[:10])
+        message = f"发现 {len(self.duplicate_ids)} 个重复的Essay_id: {sample}{' ...' if len(self.duplicate_ids) > 10 else ''}"
+        if self.reject_duplicate_ids:
+            raise ValueError(message)
+        print(f"⚠️ {message} (按ID查找时返回第一次出现的行)")
+    
+    def assign_splits(self, dataset: Dataset) -> Dict[str, np.ndarray]:
+        """按Essay_id的稳定哈希逐块划分数据集，返回每个划分的行索引"""
+        required = ["Essay_id", "Overall_score"] if self.stratify else ["Essay_id"]
+        missing = [col for col in required if col not in dataset.column_names]
+        if missing:
+            raise ValueError(f"划分数据集需要的列不存在: {missing}")
+        
+        # 分界点是固定的累计比例而不是按数据求的分位数：一行的划分只取决于Essay_id和比例，
+        # 增删其他行不会改变它；哈希与分数无关，每个分数段内的比例在期望上即为给定比例
+        names = list(self.split_ratios.keys())
+        cutoffs = np.cumsum(list(self.split_ratios.values()))
+        cutoffs[-1] = 1.0
+        
+        indices = {name: [] for name in names}
+        band_counts = np.zeros((10, len(names)), dtype=np.int64)
+        columns = dataset.select_columns(required)
+        offset = 0
+        for batch in columns.iter(batch_size=self.chunk_size):
+            units = stable_hash_unit(batch["Essay_id"])
+            labels = np.minimum(np.searchsorted(cutoffs, units, side="right"), len(names) - 1)
+            if self.stratify:
+                np.add.at(band_counts, (score_band(batch["Overall_score"]), labels), 1)
+            for i, name in enumerate(names):
+                indices[name].append(np.flatnonzero(labels == i) + offset)
+            offset += len(units)
+        
+        result = {
+            name: np.concatenate(parts) if parts else np.array([], dtype=np.int64)
+            for name, parts in indices.items()
+        }
+        self.split_counts = {name: int(len(idx)) for name, idx in result.items()}
+        print(f"数据集划分: {self.split_counts}")
+        if self.stratify:
+            for band in np.flatnonzero(band_counts.sum(axis=1)):
+                counts = dict(zip(names, band_counts[band].tolist()))
+                print(f"  Overall_score={band}: {counts}")
+        return result
+    
     def save_dataset(self, dataset: Dataset) -> str:
         """保存数据集到本地"""
         os.makedirs(self.output_dir, exist_ok=True)
         
         # 保存为DatasetDict格式
-        dataset_dict = DatasetDict({
-            "train": dataset
-        })
+        if self.split_ratios:
+            split_indices = self.assign_splits(dataset)
+            dataset_dict = DatasetDict({
+                name: dataset.select(idx) for name, idx in split_indices.items()
+            })
+        else:
+            self.split_counts = None
+            dataset_dict = DatasetDict({
+                "train": dataset
+            })
         
-        # 保存数据集
-        dataset_path = os.path.join(self.output_dir, "dataset")
-        dataset_dict.save_to_disk(dataset_path)
+        # 写入新的构建目录，完成后原子发布；正在读取旧构建的查看器不受影响
+        publisher = BuildPublisher(self.output_dir)
+        self.build_dir = publisher.new_build()
+        try:
+            build_dataset_path = os.path.join(self.build_dir, "dataset")
+            dataset_dict.save_to_disk(build_dataset_path)
+            
+            for split in dataset_dict:
+                finalize_split(os.path.join(build_dataset_path, split), self.dictionary_columns)
+            
+            # 保存配置文件
+            config = self.create_dataset_config()
+            with open(os.path.join(self.build_dir, "dataset_info.json"), 'w', encoding='utf-8') as f:
+                json.dump(config, f, ensure_ascii=False, indent=2)
+            
+            # 保存README
+            self.create_readme(self.build_dir)
+        except BaseException:
+            publisher.discard(self.build_dir)
+            raise
         
-        # 保存配置文件
-        config = self.create_dataset_config()
+        publisher.publish(self.build_dir)
+        dataset_path = os.path.join(self.output_dir, "dataset")
         config_path = os.path.join(self.output_dir, "dataset_info.json")
-        with open(config_path, 'w', encoding='utf-8') as f:
-            json.dump(config, f, ensure_ascii=False, indent=2)
-        
-        # 保存README
-        self.create_readme()
         
         print(f"数据集已保存到: {dataset_path}")
         print(f"配置文件已保存到: {config_path}")
         
         return dataset_path
     
-    def create_readme(self):
+    def create_readme(self, target_dir: Optional[str] = None):
         """创建README文件"""
         readme_content = f"""# Essay Feedback Dataset
 
@@ -206,7 +368,7 @@ print(df.describe())
 ```
 """
         
-        readme_path = os.path.join(self.output_dir, "README.md")
+        readme_path = os.path.join(target_dir or self.output_dir, "README.md")
         with open(readme_path, 'w', encoding='utf-8') as f:
             f.write(readme_content)
         
@@ -217,16 +379,26 @@ print(df.describe())
         print("开始Excel到Hugging Face数据集转换...")
         
         # 1. 加载数据
-        self.load_excel()
+        with self.profiler.stage("load_excel") as stage:
+            self.load_excel()
+            stage.rows = len(self.df)
         
         # 2. 分析数据
-        analysis = self.analyze_data()
+        with self.profiler.stage("analyze_data") as stage:
+            analysis = self.analyze_data()
+            stage.rows = len(self.df)
         
         # 3. 转换为Hugging Face格式
-        dataset = self.convert_to_huggingface()
+        with self.profiler.stage("convert_to_huggingface") as stage:
+            dataset = self.convert_to_huggingface()
+            stage.rows = len(dataset)
         
         # 4. 保存数据集
-        dataset_path = self.save_dataset(dataset)
+        with self.profiler.stage("save_dataset") as stage:
+            dataset_path = self.save_dataset(dataset)
+            stage.rows = len(dataset)
+            if self.profiler.enabled:
+                stage.bytes_written = directory_size(self.build_dir)
         
         print("转换完成！")
         return dataset_path, analysis
@@ -235,12 +407,45 @@ def main():
     parser = argparse.ArgumentParser(description="将Excel文件转换为Hugging Face数据集格式")
     parser.add_argument("--excel_file", "-f", required=True, help="Excel文件路径")
     parser.add_argument("--output_dir", "-o", default="huggingface_dataset", help="输出目录")
+    parser.add_argument("--splits", "-s", help="按Essay_id哈希划分数据集，例如 train=0.8,validation=0.1,test=0.1")
+    parser.add_argument("--stratify", action="store_true", help="按Overall_score分数段分层并报告各段的划分比例")
+    parser.add_argument("--chunk_size", type=int, default=10000, help="逐块处理时每块的行数")
+    parser.add_argument("--profile", help="输出分阶段性能追踪JSON文件路径")
+    parser.add_argument("--cprofile_dir", help="为每个阶段保存cProfile结果的目录 (需配合 --profile)")
+    parser.add_argument("--trace_memory", action="store_true",
+                        help="同时用tracemalloc统计Python分配 (需配合 --profile，会拖慢计时)")
+    parser.add_argument("--dictionary_ratio", type=float, default=DICTIONARY_MAX_RATIO,
+                        help="不同取值数/行数不超过该比例的文本列使用字典编码，设为0可关闭")
+    parser.add_argument("--version", help="数据集版本号，使用快照存储时默认在最新版本上递增")
+    parser.add_argument("--reject_duplicate_ids", action="store_true", help="Essay_id重复时终止转换 (默认只报告)")
+    parser.add_argument("--snapshot_store", help="转换完成后将输出保存为去重快照的存储目录")
     
     args = parser.parse_args()
     
-    converter = ExcelToHuggingFaceConverter(args.excel_file, args.output_dir)
+    split_ratios = parse_split_ratios(args.splits) if args.splits else None
+    store = SnapshotStore(args.snapshot_store) if args.snapshot_store else None
+    version = args.version or (store.next_version() if store else "1.0.0")
+    converter = ExcelToHuggingFaceConverter(
+        args.excel_file,
+        args.output_dir,
+        split_ratios=split_ratios,
+        stratify=args.stratify,
+        chunk_size=args.chunk_size,
+        profiler=StageProfiler(enabled=bool(args.profile), cprofile_dir=args.cprofile_dir,
+                               trace_memory=args.trace_memory),
+        version=version,
+        dictionary_ratio=args.dictionary_ratio,
+        reject_duplicate_ids=args.reject_duplicate_ids
+    )
     dataset_path, analysis = converter.run_conversion()
     
+    if args.profile:
+        converter.profiler.print_table()
+        converter.profiler.write_json(args.profile)
+    
+    if store:
+        store.commit(args.output_dir, version)
+    
     print(f"\n数据集已成功转换并保存到: {dataset_path}")
     print("您现在可以:")
     print("1. 使用 datasets.load_from_disk() 加载数据集")
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Training Data Exporter
+将作文→反馈对按模板渲染、并行分词，并打包为定长序列的内存映射NumPy文件
+"""
+
+import os
+import json
+import string
+import argparse
+import numpy as np
+from typing import Dict, Any, List, Optional, Iterator, Tuple
+
+from dataset_query import DatasetQuery
+
+# 每个生成目标对应的默认提示模板，可通过 --templates 覆盖
+DEFAULT_TEMPLATES = {
+    "Feedback_TR": "Essay prompt: {Essay_Prompt}\n\nEssay:\n{Essay}\n\nGive feedback on Task Response:\n",
+    "Feedback_CC": "Essay prompt: {Essay_Prompt}\n\nEssay:\n{Essay}\n\nGive feedback on Coherence and Cohesion:\n",
+    "Feedback_LR": "Essay prompt: {Essay_Prompt}\n\nEssay:\n{Essay}\n\nGive feedback on Lexical Resource:\n",
+    "Feedback_GRA": "Essay prompt: {Essay_Prompt}\n\nEssay:\n{Essay}\n\nGive feedback on Grammatical Range and Accuracy:\n",
+    "Suggestion for improvement": "Essay prompt: {Essay_Prompt}\n\nEssay:\n{Essay}\n\nSuggest how to improve this essay:\n"
+}
+
+TOKENS_FILE = "tokens.bin"
+LOSS_MASK_FILE = "loss_mask.bin"
+OFFSETS_FILE = "offsets.npy"
+EXAMPLES_FILE = "examples.npy"
+META_FILE = "meta.json"
+
+
+def load_templates(path: Optional[str]) -> Dict[str, str]:
+    """读取 {目标列: 提示模板} 形式的JSON模板文件"""
+    if not path:
+        return dict(DEFAULT_TEMPLATES)
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def template_columns(templates: Dict[str, str]) -> List[str]:
+    """模板和目标用到的所有列"""
+    columns = ["Essay_id"]
+    for target, template in templates.items():
+        for _, field, _, _ in string.Formatter().parse(template):
+            if field and field not in columns:
+                columns.append(field)
+        if target not in columns:
+            columns.append(target)
+    return columns
+
+
+def load_packed(output_dir: str) -> Dict[str, Any]:
+    """以内存映射方式打开导出结果，供训练数据加载器直接读取"""
+    with open(os.path.join(output_dir, META_FILE), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    shape = (meta["num_sequences"], meta["seq_len"])
+    return {
+        "meta": meta,
+        "tokens": np.memmap(os.path.join(output_dir, TOKENS_FILE), dtype=meta["dtype"], mode='r', shape=shape),
+        "loss_mask": np.memmap(os.path.join(output_dir, LOSS_MASK_FILE), dtype=np.uint8, mode='r', shape=shape),
+        "offsets": np.load(os.path.join(output_dir, OFFSETS_FILE), mmap_mode='r'),
+        "examples": np.load(os.path.join(output_dir, EXAMPLES_FILE), mmap_mode='r')
+    }
+
+
+class TrainingExporter:
+    def __init__(self, dataset_path: str, tokenizer_file: str, output_dir: str,
+                 seq_len: int = 2048, templates: Optional[Dict[str, str]] = None,
+                 split: str = "train"):
+        self.dataset_path = dataset_path
+        self.tokenizer_file = tokenizer_file
+        self.output_dir = output_dir
+        self.seq_len = seq_len
+        self.templates = templates or dict(DEFAULT_TEMPLATES)
+        self.split = split
+        self.tokenizer = None
+
+    def load_tokenizer(self):
+        """加载本地 tokenizer.json (Hugging Face tokenizers 格式)"""
+        try:
+            from tokenizers import Tokenizer
+        except ImportError:
+            raise ImportError("导出训练数据需要安装 tokenizers: pip install tokenizers")
+        self.tokenizer = Tokenizer.from_file(self.tokenizer_file)
+        self.tokenizer.no_padding()
+        self.tokenizer.no_truncation()
+        vocab_size = self.tokenizer.get_vocab_size(with_added_tokens=True)
+        self.dtype = np.uint16 if vocab_size <= np.iinfo(np.uint16).max else np.uint32
+        self.eos_id = self._special_id(["</s>", "<|endoftext|>", "[SEP]", "<eos>"])
+        self.pad_id = self._special_id(["<pad>", "[PAD]", "<|endoftext|>"], default=self.eos_id)
+        return self.tokenizer
+
+    def _special_id(self, candidates: List[str], default: Optional[int] = None) -> Optional[int]:
+        for token in candidates:
+            token_id = self.tokenizer.token_to_id(token)
+            if token_id is not None:
+                return token_id
+        return default
+
+    def render_pairs(self) -> Iterator[Tuple[List[Tuple[int, int]], List[str], List[str]]]:
+        """按数据集的Arrow批次渲染 (提示, 目标) 对，只读取模板用到的列"""
+        query = DatasetQuery(self.dataset_path)
+        targets = list(self.templates.keys())
+        for batch in query.iter_batches(template_columns(self.templates), split=self.split):
+            rows = batch.to_pylist()
+            keys, prompts, completions = [], [], []
+            for row in rows:
+                for target_index, target in enumerate(targets):
+                    if not row[target]:
+                        continue
+                    keys.append((row["Essay_id"], target_index))
+                    prompts.append(self.templates[target].format_map(row))
+                    completions.append(row[target])
+            yield keys, prompts, completions
+
+    def export(self) -> Dict[str, Any]:
+        """导出打包后的训练数据"""
+        if self.tokenizer is None:
+            self.load_tokenizer()
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        tokens_path = os.path.join(self.output_dir, TOKENS_FILE)
+        mask_path = os.path.join(self.output_dir, LOSS_MASK_FILE)
+        lengths, examples = [], []
+        pending_tokens = np.empty(0, dtype=self.dtype)
+        pending_mask = np.empty(0, dtype=np.uint8)
+        num_sequences = 0
+
+        with open(tokens_path, 'wb') as tokens_file, open(mask_path, 'wb') as mask_file:
+            for keys, prompts, completions in self.render_pairs():
+                if not keys:
+                    continue
+                # encode_batch 在 Rust 端多线程并行分词
+                prompt_encodings = self.tokenizer.encode_batch(prompts, add_special_tokens=False)
+                completion_encodings = self.tokenizer.encode_batch(completions, add_special_tokens=False)
+
+                token_parts, mask_parts = [pending_tokens], [pending_mask]
+                batch_lengths = np.empty(len(keys), dtype=np.int64)
+                for i, (prompt, completion) in enumerate(zip(prompt_encodings, completion_encodings)):
+                    target_ids = completion.ids + ([self.eos_id] if self.eos_id is not None else [])
+                    token_parts.append(np.asarray(prompt.ids + target_ids, dtype=self.dtype))
+                    # 只在目标部分计算损失
+                    mask_parts.append(np.concatenate([np.zeros(len(prompt.ids), dtype=np.uint8),
+                                                      np.ones(len(target_ids), dtype=np.uint8)]))
+                    batch_lengths[i] = len(prompt.ids) + len(target_ids)
+                lengths.append(batch_lengths)
+                examples.append(np.asarray(keys, dtype=np.int64))
+
+                stream = np.concatenate(token_parts)
+                stream_mask = np.concatenate(mask_parts)
+                full = len(stream) // self.seq_len * self.seq_len
+                stream[:full].tofile(tokens_file)
+                stream_mask[:full].tofile(mask_file)
+                num_sequences += full // self.seq_len
+                pending_tokens, pending_mask = stream[full:], stream_mask[full:]
+
+            # 最后一个不满的序列用pad补齐，pad位置不计算损失
+            if len(pending_tokens):
+                padding = self.seq_len - len(pending_tokens)
+                pad_id = self.pad_id if self.pad_id is not None else 0
+                np.concatenate([pending_tokens, np.full(padding, pad_id, dtype=self.dtype)]).tofile(tokens_file)
+                np.concatenate([pending_mask, np.zeros(padding, dtype=np.uint8)]).tofile(mask_file)
+                num_sequences += 1
+
+        # offsets[i] 为第i个样本在展平token流中的起始位置，最后一项为token总数
+        offsets = np.concatenate([[0], np.cumsum(np.concatenate(lengths))]) if lengths else np.zeros(1, dtype=np.int64)
+        examples = np.concatenate(examples) if examples else np.empty((0, 2), dtype=np.int64)
+        np.save(os.path.join(self.output_dir, OFFSETS_FILE), offsets.astype(np.int64))
+        np.save(os.path.join(self.output_dir, EXAMPLES_FILE), examples)
+
+        meta = {
+            "dataset_path": self.dataset_path,
+            "split": self.split,
+            "tokenizer_file": self.tokenizer_file,
+            "seq_len": self.seq_len,
+            "dtype": np.dtype(self.dtype).name,
+            "num_sequences": num_sequences,
+            "num_tokens": int(offsets[-1]),
+            "num_examples": len(examples),
+            "eos_id": self.eos_id,
+            "pad_id": self.pad_id,
+            "targets": list(self.templates.keys()),
+            "templates": self.templates,
+            "files": {
+                "tokens": TOKENS_FILE,
+                "loss_mask": LOSS_MASK_FILE,
+                "offsets": OFFSETS_FILE,
+                "examples": EXAMPLES_FILE
+            }
+        }
+        with open(os.path.join(self.output_dir, META_FILE), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+        print(f"✅ 导出 {len(examples)} 个样本，{offsets[-1]} 个token，打包为 {num_sequences} 个长度 {self.seq_len} 的序列")
+        print(f"训练数据已保存到: {self.output_dir}")
+        return meta
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导出作文→反馈生成任务的打包训练数据")
+    parser.add_argument("--dataset_path", "-d", required=True, help="本地数据集路径")
+    parser.add_argument("--tokenizer", "-t", required=True, help="本地 tokenizer.json 文件")
+    parser.add_argument("--output_dir", "-o", default="training_export", help="输出目录")
+    parser.add_argument("--seq_len", type=int, default=2048, help="打包序列长度")
+    parser.add_argument("--templates", help="JSON模板文件，格式为 {目标列: 提示模板}")
+    parser.add_argument("--split", default="train", help="数据集划分")
+
+    args = parser.parse_args()
+
+    exporter = TrainingExporter(
+        args.dataset_path,
+        args.tokenizer,
+        args.output_dir,
+        seq_len=args.seq_len,
+        templates=load_templates(args.templates),
+        split=args.split
+    )
+    exporter.export()
+
+
+if __name__ == "__main__":
+    main()
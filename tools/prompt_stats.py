@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Prompt Statistics
+基于Arrow表的按作文题目分组聚合：计数、均值、分位数和分数段直方图，可跨分片合并并按数据集指纹缓存
+"""
+
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from typing import Dict, Any, List, Optional
+
+from dataset_query import shard_files, open_shard, dataset_fingerprint
+
+GROUP_COLUMN = "Essay_Prompt"
+SCORE_COLUMNS = ['Essay_score', 'Overall_score', 'Score_TR', 'Score_CC', 'Score_LR', 'Score_GRA']
+# 直方图按0-9分的整数分数段统计，超出范围的分数计入两端
+NUM_BANDS = 10
+QUANTILES = [0.25, 0.5, 0.75]
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "essay_feedback", "prompt_stats")
+
+
+class PromptAggregator:
+    """可合并的分组聚合状态：每个题目、每个分数列的计数、总和与分数段直方图"""
+
+    def __init__(self, score_columns: Optional[List[str]] = None):
+        self.score_columns = score_columns or list(SCORE_COLUMNS)
+        self.groups: Dict[str, int] = {}
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.sums = np.zeros((0, len(self.score_columns)), dtype=np.float64)
+        self.histograms = np.zeros((0, len(self.score_columns), NUM_BANDS), dtype=np.int64)
+
+    def _grow(self, size: int):
+        extra = size - len(self.counts)
+        if extra <= 0:
+            return
+        self.counts = np.concatenate([self.counts, np.zeros(extra, dtype=np.int64)])
+        self.sums = np.concatenate([self.sums, np.zeros((extra,) + self.sums.shape[1:])])
+        self.histograms = np.concatenate([self.histograms, np.zeros((extra,) + self.histograms.shape[1:], dtype=np.int64)])
+
+    def _group_ids(self, column: pa.Array) -> np.ndarray:
+        """把批次内的题目映射为全局分组号；只对字典中的不同值做Python查找"""
+        if not pa.types.is_dictionary(column.type):
+            column = pc.dictionary_encode(column)
+        local_to_global = np.empty(len(column.dictionary), dtype=np.int64)
+        for i, value in enumerate(column.dictionary.to_pylist()):
+            local_to_global[i] = self.groups.setdefault(value, len(self.groups))
+        self._grow(len(self.groups))
+        return local_to_global[column.indices.to_numpy(zero_copy_only=False)]
+
+    def update(self, batch: pa.RecordBatch):
+        """累加一个Arrow批次"""
+        if batch.num_rows == 0:
+            return
+        group_ids = self._group_ids(batch.column(GROUP_COLUMN))
+        num_groups = len(self.groups)
+        self.counts += np.bincount(group_ids, minlength=num_groups)
+        for c, name in enumerate(self.score_columns):
+            if name not in batch.schema.names:
+                continue
+            scores = batch.column(name).to_numpy(zero_copy_only=False)
+            self.sums[:, c] += np.bincount(group_ids, weights=scores, minlength=num_groups)
+            bands = np.clip(scores, 0, NUM_BANDS - 1).astype(np.int64)
+            self.histograms[:, c, :] += np.bincount(group_ids * NUM_BANDS + bands,
+                                                    minlength=num_groups * NUM_BANDS).reshape(num_groups, NUM_BANDS)
+
+    def merge(self, other: "PromptAggregator") -> "PromptAggregator":
+        """合并另一个分片的聚合状态"""
+        if other.score_columns != self.score_columns:
+            raise ValueError("无法合并分数列不同的聚合结果")
+        mapping = np.array([self.groups.setdefault(value, len(self.groups)) for value in other.groups],
+                           dtype=np.int64)
+        self._grow(len(self.groups))
+        if len(mapping):
+            np.add.at(self.counts, mapping, other.counts)
+            np.add.at(self.sums, mapping, other.sums)
+            np.add.at(self.histograms, mapping, other.histograms)
+        return self
+
+    def _quantiles(self, c: int) -> np.ndarray:
+        """由整数分数直方图得到精确的分位数 (下分位数)"""
+        cumulative = np.cumsum(self.histograms[:, c, :], axis=1)
+        totals = cumulative[:, -1:]
+        result = np.empty((len(self.counts), len(QUANTILES)))
+        for q, quantile in enumerate(QUANTILES):
+            targets = np.maximum(np.ceil(totals * quantile), 1)
+            result[:, q] = (cumulative < targets).sum(axis=1)
+        result[totals[:, 0] == 0] = np.nan
+        return result
+
+    def summary(self) -> pd.DataFrame:
+        """每个题目一行：计数、各分数列均值和分位数"""
+        prompts = list(self.groups.keys())
+        data = {GROUP_COLUMN: prompts, "count": self.counts}
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = self.sums / self.counts[:, None]
+        for c, name in enumerate(self.score_columns):
+            data[f"{name}_mean"] = means[:, c]
+            quantiles = self._quantiles(c)
+            for q, quantile in enumerate(QUANTILES):
+                data[f"{name}_p{int(quantile * 100)}"] = quantiles[:, q]
+        return pd.DataFrame(data).sort_values("count", ascending=False, kind="stable").reset_index(drop=True)
+
+    def histogram(self, score_column: str) -> pd.DataFrame:
+        """指定分数列的题目×分数段计数表"""
+        c = self.score_columns.index(score_column)
+        return pd.DataFrame(self.histograms[:, c, :], index=list(self.groups.keys()),
+                            columns=list(range(NUM_BANDS)))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "score_columns": self.score_columns,
+            "prompts": list(self.groups.keys()),
+            "counts": self.counts.tolist(),
+            "sums": self.sums.tolist(),
+            "histograms": self.histograms.tolist()
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "PromptAggregator":
+        aggregator = cls(data["score_columns"])
+        aggregator.groups = {prompt: i for i, prompt in enumerate(data["prompts"])}
+        n = len(data["prompts"])
+        aggregator.counts = np.asarray(data["counts"], dtype=np.int64).reshape(n)
+        aggregator.sums = np.asarray(data["sums"], dtype=np.float64).reshape(n, len(aggregator.score_columns))
+        aggregator.histograms = np.asarray(data["histograms"], dtype=np.int64).reshape(
+            n, len(aggregator.score_columns), NUM_BANDS)
+        return aggregator
+
+
+def aggregate_split(split_path: str) -> PromptAggregator:
+    """逐分片聚合后合并，只读取题目列和分数列"""
+    result = None
+    for filename in shard_files(split_path):
+        reader = open_shard(os.path.join(split_path, filename))
+        if GROUP_COLUMN not in reader.schema.names:
+            continue  # 没有题目列的数据集得到空的统计
+        score_columns = [name for name in SCORE_COLUMNS if name in reader.schema.names]
+        shard = PromptAggregator(score_columns)
+        for batch in reader:
+            shard.update(batch.select([GROUP_COLUMN] + score_columns))
+        result = shard if result is None else result.merge(shard)
+    return result or PromptAggregator()
+
+
+def load_prompt_stats(dataset_path: str, split: str = "train",
+                      cache_dir: Optional[str] = DEFAULT_CACHE_DIR) -> PromptAggregator:
+    """按数据集指纹缓存聚合结果，数据集重新生成后自动失效"""
+    cache_path = None
+    if cache_dir:
+        fingerprint = dataset_fingerprint(dataset_path)
+        cache_path = os.path.join(cache_dir, f"{fingerprint}-{split}.json")
+        if os.path.exists(cache_path):
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                return PromptAggregator.from_dict(json.load(f))
+
+    aggregator = aggregate_split(os.path.join(dataset_path, split))
+
+    if cache_path:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{cache_path}.tmp{os.getpid()}"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(aggregator.to_dict(), f, ensure_ascii=False)
+        os.replace(tmp_path, cache_path)
+    return aggregator
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按作文题目统计评分分布")
+    parser.add_argument("--dataset_path", "-d", required=True, help="本地数据集路径")
+    parser.add_argument("--split", default="train", help="数据集划分")
+    parser.add_argument("--score", default="Score_TR", help="显示直方图的分数列")
+    parser.add_argument("--top", type=int, default=20, help="显示的题目数")
+    parser.add_argument("--no_cache", action="store_true", help="不读取或写入缓存")
+
+    args = parser.parse_args()
+
+    aggregator = load_prompt_stats(args.dataset_path, args.split, None if args.no_cache else DEFAULT_CACHE_DIR)
+    summary = aggregator.summary().head(args.top)
+    print(f"共 {len(aggregator.groups)} 个题目")
+    print(summary.assign(**{GROUP_COLUMN: summary[GROUP_COLUMN].str.slice(0, 40)}).to_string())
+
+    print(f"\n=== {args.score} 分数段直方图 ===")
+    histogram = aggregator.histogram(args.score).loc[summary[GROUP_COLUMN]]
+    histogram.index = histogram.index.str.slice(0, 40)
+    print(histogram.to_string())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Dataset Snapshot Store
+按内容定义分块、以哈希去重存储数据集的各个版本，支持检出任意版本和按Essay_id比较两个版本
+"""
+
+import os
+import io
+import json
+import zlib
+import hashlib
+import fnmatch
+import argparse
+import numpy as np
+import pandas as pd
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Iterator, Tuple
+
+from dataset_query import open_split_table, has_id_column
+from build_publisher import current_build
+
+try:
+    import fcntl
+except ImportError:  # Windows 上没有 flock，此时不加锁
+    fcntl = None
+
+# 存储目录中的锁文件：commit / delete / gc 持排他锁，checkout / diff 持共享锁
+LOCK_FILE = "lock"
+
+# datasets 的 .map() / .filter() 在数据旁写入的缓存文件，不属于数据集版本
+SKIPPED_FILES = ["cache-*.arrow"]
+
+# 内容定义分块参数：平均约64KB，限制在16KB-256KB之间
+CDC_WINDOW = 48
+CDC_MASK_BITS = 16
+CDC_MIN_SIZE = 16 * 1024
+CDC_MAX_SIZE = 256 * 1024
+CDC_BLOCK_SIZE = 8 * 1024 * 1024
+
+# 固定种子生成的字节→随机数映射表，保证不同机器上分块边界一致
+_GEAR = np.random.default_rng(0x5EED).integers(0, 2 ** 63, size=256, dtype=np.uint64)
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _boundary_candidates(data: np.ndarray) -> np.ndarray:
+    """返回窗口哈希满足条件的位置 (切点为该位置之后)
+
+    窗口哈希为最近 CDC_WINDOW 个字节映射值之和，可用前缀和向量化计算，
+    只依赖窗口内的内容，因此插入或删除只影响附近的切点。
+    """
+    values = _GEAR[data]
+    prefix = np.cumsum(values, dtype=np.uint64)
+    window = prefix[CDC_WINDOW - 1:].copy()
+    window[1:] -= prefix[:-CDC_WINDOW]
+    mixed = (window * _MIX) >> np.uint64(64 - CDC_MASK_BITS)
+    return np.flatnonzero(mixed == 0) + CDC_WINDOW
+
+
+def iter_chunks(path: str) -> Iterator[bytes]:
+    """按内容定义的边界切分文件"""
+    with open(path, 'rb') as f:
+        pending = b""
+        while True:
+            block = f.read(CDC_BLOCK_SIZE)
+            buffer = pending + block
+            if not buffer:
+                return
+            last = not block
+            data = np.frombuffer(buffer, dtype=np.uint8)
+            candidates = _boundary_candidates(data) if len(data) >= CDC_WINDOW else np.empty(0, dtype=np.int64)
+
+            start = 0
+            for cut in candidates:
+                while cut - start > CDC_MAX_SIZE:
+                    yield buffer[start:start + CDC_MAX_SIZE]
+                    start += CDC_MAX_SIZE
+                if cut - start >= CDC_MIN_SIZE:
+                    yield buffer[start:cut]
+                    start = cut
+            if last:
+                while start < len(buffer):
+                    yield buffer[start:start + CDC_MAX_SIZE]
+                    start += CDC_MAX_SIZE
+                return
+            # 未切完的尾部与下一块一起处理，保证边界与读取块大小无关
+            while len(buffer) - start > CDC_MAX_SIZE + CDC_BLOCK_SIZE:
+                yield buffer[start:start + CDC_MAX_SIZE]
+                start += CDC_MAX_SIZE
+            pending = buffer[start:]
+
+
+def chunk_hash(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+def row_hashes(split_path: str) -> np.ndarray:
+    """计算每行内容的64位哈希，返回按Essay_id排序的 (id, hash) 结构化数组"""
+    table = open_split_table(split_path)
+    ids, hashes = [], []
+    for batch in table.to_batches():
+        df = batch.to_pandas()
+        ids.append(df["Essay_id"].to_numpy(dtype=np.int64))
+        hashes.append(pd.util.hash_pandas_object(df, index=False).to_numpy(dtype=np.uint64))
+    index = np.empty(sum(len(i) for i in ids), dtype=[("id", np.int64), ("hash", np.uint64)])
+    if ids:
+        index["id"] = np.concatenate(ids)
+        index["hash"] = np.concatenate(hashes)
+    return np.sort(index, order="id")
+
+
+class SnapshotStore:
+    def __init__(self, store_dir: str):
+        self.store_dir = store_dir
+        self.objects_dir = os.path.join(store_dir, "objects")
+        self.versions_dir = os.path.join(store_dir, "versions")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.versions_dir, exist_ok=True)
+
+    @contextmanager
+    def _locked(self, exclusive: bool = True):
+        """对整个存储加锁，避免 gc 删除并发提交刚写入、尚未被清单引用的数据块"""
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.store_dir, LOCK_FILE), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.objects_dir, digest[:2], digest[2:])
+
+    def _write_atomic(self, path: str, data: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def put_object(self, data: bytes) -> Tuple[str, bool]:
+        """按内容哈希保存数据块，已存在时跳过；返回 (哈希, 是否新写入)"""
+        digest = chunk_hash(data)
+        path = self._object_path(digest)
+        if os.path.exists(path):
+            return digest, False
+        self._write_atomic(path, zlib.compress(data, 3))
+        return digest, True
+
+    def get_object(self, digest: str) -> bytes:
+        with open(self._object_path(digest), 'rb') as f:
+            data = zlib.decompress(f.read())
+        if chunk_hash(data) != digest:
+            raise ValueError(f"数据块校验失败: {digest}")
+        return data
+
+    def versions(self) -> List[str]:
+        """按提交时间排列的版本列表"""
+        manifests = [self.load_manifest(name[:-5]) for name in os.listdir(self.versions_dir) if name.endswith(".json")]
+        return [m["version"] for m in sorted(manifests, key=lambda m: m["created"])]
+
+    def load_manifest(self, version: str) -> Dict[str, Any]:
+        path = os.path.join(self.versions_dir, f"{version}.json")
+        if not os.path.exists(path):
+            raise ValueError(f"版本不存在: {version}")
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def next_version(self, default: str = "1.0.0") -> str:
+        """在最新版本的基础上递增修订号"""
+        versions = self.versions()
+        if not versions:
+            return default
+        parts = versions[-1].split(".")
+        if len(parts) == 3 and all(p.isdigit() for p in parts):
+            return f"{parts[0]}.{parts[1]}.{int(parts[2]) + 1}"
+        return f"{versions[-1]}.1"
+
+    def commit(self, dataset_dir: str, version: Optional[str] = None, message: str = "") -> Dict[str, Any]:
+        """将数据集目录保存为一个新版本"""
+        with self._locked():
+            version = version or self.next_version()
+            if os.path.exists(os.path.join(self.versions_dir, f"{version}.json")):
+                raise ValueError(f"版本已存在: {version}")
+
+            # 转换器输出目录中保存的是当前发布的构建
+            dataset_dir = current_build(dataset_dir) or dataset_dir
+            files = {}
+            logical_bytes = stored_chunks = total_chunks = 0
+            for root, _, names in os.walk(dataset_dir):
+                for name in sorted(names):
+                    if any(fnmatch.fnmatch(name, pattern) for pattern in SKIPPED_FILES):
+                        continue
+                    path = os.path.join(root, name)
+                    relpath = os.path.relpath(path, dataset_dir).replace(os.sep, "/")
+                    chunks = []
+                    for data in iter_chunks(path):
+                        digest, new = self.put_object(data)
+                        chunks.append(digest)
+                        stored_chunks += new
+                    total_chunks += len(chunks)
+                    size = os.path.getsize(path)
+                    logical_bytes += size
+                    files[relpath] = {"size": size, "chunks": chunks}
+
+            # 每个划分记录按Essay_id排序的行哈希，用于版本比较；没有Essay_id列的划分不记录
+            row_index = {}
+            dataset_path = self._find_dataset(dataset_dir)
+            if dataset_path:
+                with open(os.path.join(dataset_path, "dataset_dict.json"), 'r', encoding='utf-8') as f:
+                    splits = json.load(f)["splits"]
+                for split in splits:
+                    if not has_id_column(os.path.join(dataset_path, split)):
+                        continue
+                    buffer = io.BytesIO()
+                    np.save(buffer, row_hashes(os.path.join(dataset_path, split)))
+                    row_index[split], _ = self.put_object(buffer.getvalue())
+
+            versions = self.versions()
+            manifest = {
+                "version": version,
+                "parent": versions[-1] if versions else None,
+                "created": datetime.now(timezone.utc).isoformat(),
+                "message": message,
+                "logical_bytes": logical_bytes,
+                "files": files,
+                "row_index": row_index
+            }
+            self._write_atomic(os.path.join(self.versions_dir, f"{version}.json"),
+                               json.dumps(manifest, ensure_ascii=False, indent=1).encode("utf-8"))
+            print(f"✅ 已保存版本 {version}: {len(files)} 个文件，{total_chunks} 个数据块，其中新数据块 {stored_chunks} 个")
+            return manifest
+
+    def _find_dataset(self, dataset_dir: str) -> Optional[str]:
+        """兼容转换器输出目录 (含 dataset/ 子目录) 和 save_to_disk 目录本身"""
+        for candidate in (os.path.join(dataset_dir, "dataset"), dataset_dir):
+            if os.path.exists(os.path.join(candidate, "dataset_dict.json")):
+                return candidate
+        return None
+
+    def checkout(self, version: str, target_dir: str) -> str:
+        """将指定版本还原到目标目录"""
+        with self._locked(exclusive=False):
+            manifest = self.load_manifest(version)
+            if os.path.exists(target_dir) and os.listdir(target_dir):
+                raise ValueError(f"目标目录非空: {target_dir}")
+            for relpath, entry in manifest["files"].items():
+                path = os.path.join(target_dir, *relpath.split("/"))
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'wb') as f:
+                    for digest in entry["chunks"]:
+                        f.write(self.get_object(digest))
+            print(f"✅ 版本 {version} 已检出到: {target_dir}")
+            return target_dir
+
+    def load_row_index(self, version: str, split: str) -> np.ndarray:
+        manifest = self.load_manifest(version)
+        if split not in manifest["row_index"]:
+            if any(f"/{split}/" in f"/{relpath}" for relpath in manifest["files"]):
+                raise ValueError(f"版本 {version} 的划分 {split} 没有Essay_id列，无法按ID比较")
+            raise ValueError(f"版本 {version} 中没有划分: {split}")
+        return np.load(io.BytesIO(self.get_object(manifest["row_index"][split])))
+
+    def diff(self, old_version: str, new_version: str, split: str = "train") -> Dict[str, List[int]]:
+        """按Essay_id比较两个版本，返回新增、删除和内容变化的ID"""
+        with self._locked(exclusive=False):
+            old = self.load_row_index(old_version, split)
+            new = self.load_row_index(new_version, split)
+            common, old_pos, new_pos = np.intersect1d(old["id"], new["id"], assume_unique=False, return_indices=True)
+            changed = common[old["hash"][old_pos] != new["hash"][new_pos]]
+            return {
+                "added": np.setdiff1d(new["id"], old["id"], assume_unique=False).tolist(),
+                "removed": np.setdiff1d(old["id"], new["id"], assume_unique=False).tolist(),
+                "changed": changed.tolist()
+            }
+
+    def delete(self, version: str):
+        """删除版本清单，数据块由 gc 回收"""
+        with self._locked():
+            self.load_manifest(version)
+            os.remove(os.path.join(self.versions_dir, f"{version}.json"))
+            print(f"🗑️ 已删除版本 {version}")
+
+    def gc(self) -> int:
+        """删除不再被任何版本引用的数据块"""
+        with self._locked():
+            referenced = set()
+            for version in self.versions():
+                manifest = self.load_manifest(version)
+                for entry in manifest["files"].values():
+                    referenced.update(entry["chunks"])
+                referenced.update(manifest["row_index"].values())
+
+            removed = 0
+            for prefix in os.listdir(self.objects_dir):
+                prefix_dir = os.path.join(self.objects_dir, prefix)
+                for name in os.listdir(prefix_dir):
+                    if prefix + name not in referenced:
+                        os.remove(os.path.join(prefix_dir, name))
+                        removed += 1
+            print(f"🗑️ 回收 {removed} 个未引用的数据块")
+            return removed
+
+    def usage(self) -> Dict[str, int]:
+        """存储实际占用与各版本逻辑大小之和"""
+        stored = 0
+        for root, _, names in os.walk(self.objects_dir):
+            stored += sum(os.path.getsize(os.path.join(root, name)) for name in names)
+        logical = sum(self.load_manifest(v)["logical_bytes"] for v in self.versions())
+        return {"stored_bytes": stored, "logical_bytes": logical}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="数据集版本快照存储")
+    parser.add_argument("--store", "-s", default="snapshot_store", help="快照存储目录")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    commit_parser = subparsers.add_parser("commit", help="保存数据集目录为新版本")
+    commit_parser.add_argument("dataset_dir", help="转换器输出目录或 save_to_disk 目录")
+    commit_parser.add_argument("--version", help="版本号，默认在最新版本上递增")
+    commit_parser.add_argument("--message", "-m", default="", help="版本说明")
+
+    subparsers.add_parser("list", help="列出所有版本")
+
+    checkout_parser = subparsers.add_parser("checkout", help="检出指定版本")
+    checkout_parser.add_argument("version", help="版本号")
+    checkout_parser.add_argument("target_dir", help="目标目录")
+
+    diff_parser = subparsers.add_parser("diff", help="按Essay_id比较两个版本")
+    diff_parser.add_argument("old_version", help="旧版本")
+    diff_parser.add_argument("new_version", help="新版本")
+    diff_parser.add_argument("--split", default="train", help="数据集划分")
+
+    delete_parser = subparsers.add_parser("delete", help="删除版本")
+    delete_parser.add_argument("version", help="版本号")
+
+    subparsers.add_parser("gc", help="回收未引用的数据块")
+
+    args = parser.parse_args()
+    store = SnapshotStore(args.store)
+
+    if args.command == "commit":
+        store.commit(args.dataset_dir, args.version, args.message)
+    elif args.command == "list":
+        for version in store.versions():
+            manifest = store.load_manifest(version)
+            print(f"{version:<12} {manifest['created']}  {manifest['logical_bytes']:>12} bytes  {manifest['message']}")
+        usage = store.usage()
+        print(f"存储占用: {usage['stored_bytes']} bytes (各版本逻辑大小合计 {usage['logical_bytes']} bytes)")
+    elif args.command == "checkout":
+        store.checkout(args.version, args.target_dir)
+    elif args.command == "diff":
+        try:
+            result = store.diff(args.old_version, args.new_version, args.split)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return
+        for kind, ids in result.items():
+            preview = ", ".join(map(str, ids[:20])) + (" ..." if len(ids) > 20 else "")
+            print(f"{kind:<8} {len(ids):>8}  {preview}")
+    elif args.command == "delete":
+        store.delete(args.version)
+    elif args.command == "gc":
+        store.gc()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Stage Profiler
+转换流程的分阶段性能与内存统计
+"""
+
+import cProfile
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块
+    resource = None
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """返回当前进程的峰值常驻内存 (字节)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以KB为单位，macOS 以字节为单位
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def reset_peak_rss() -> bool:
+    """重置进程的峰值RSS (Linux 上写 /proc/self/clear_refs)，不支持时返回False"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def current_peak_rss_bytes() -> Optional[int]:
+    """读取 /proc/self/status 中的 VmHWM，即上次重置以来的峰值RSS (字节)"""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def directory_size(path: str) -> int:
+    """统计目录下所有文件的字节数"""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+class StageRecord:
+    """单个阶段的统计结果，阶段内可通过 rows / bytes_written 补充吞吐信息"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.rows = None
+        self.bytes_written = None
+
+
+class StageProfiler:
+    def __init__(self, enabled: bool = True, cprofile_dir: Optional[str] = None,
+                 trace_memory: bool = False):
+        self.enabled = enabled
+        self.cprofile_dir = cprofile_dir
+        # tracemalloc 会显著拖慢分配密集的阶段，默认关闭以免歪曲耗时
+        self.trace_memory = trace_memory
+        self.stages: List[Dict[str, Any]] = []
+
+    @contextmanager
+    def stage(self, name: str):
+        """记录一个阶段的墙钟时间、CPU时间、峰值RSS，开启 trace_memory 时附带tracemalloc增量"""
+        record = StageRecord(name)
+        if not self.enabled:
+            yield record
+            return
+
+        started_tracing = False
+        if self.trace_memory:
+            started_tracing = not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            traced_before, _ = tracemalloc.get_traced_memory()
+        # 能重置时记录本阶段的峰值，否则只能得到进程启动以来的峰值
+        rss_per_stage = reset_peak_rss()
+
+        profile = cProfile.Profile() if self.cprofile_dir else None
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        if profile:
+            profile.enable()
+        try:
+            yield record
+        finally:
+            if profile:
+                profile.disable()
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            if self.trace_memory:
+                traced_after, traced_peak = tracemalloc.get_traced_memory()
+                if started_tracing:
+                    tracemalloc.stop()
+            peak_rss = current_peak_rss_bytes() if rss_per_stage else None
+
+            entry = {
+                "stage": name,
+                "wall_time_s": round(wall, 6),
+                "cpu_time_s": round(cpu, 6),
+                "peak_rss_bytes": peak_rss if peak_rss is not None else peak_rss_bytes(),
+                "peak_rss_scope": "stage" if peak_rss is not None else "process",
+                "tracemalloc_delta_bytes": traced_after - traced_before if self.trace_memory else None,
+                "tracemalloc_peak_bytes": traced_peak - traced_before if self.trace_memory else None,
+                "rows": record.rows,
+                "rows_per_s": round(record.rows / wall, 2) if record.rows and wall > 0 else None,
+                "bytes_written": record.bytes_written
+            }
+            if profile:
+                os.makedirs(self.cprofile_dir, exist_ok=True)
+                profile_path = os.path.join(self.cprofile_dir, f"{name}.prof")
+                profile.dump_stats(profile_path)
+                entry["cprofile"] = profile_path
+            self.stages.append(entry)
+
+    def summary(self) -> Dict[str, Any]:
+        """汇总所有阶段"""
+        return {
+            "python": sys.version.split()[0],
+            "pid": os.getpid(),
+            "trace_memory": self.trace_memory,
+            "total_wall_time_s": round(sum(s["wall_time_s"] for s in self.stages), 6),
+            "stages": self.stages
+        }
+
+    def write_json(self, path: str):
+        """保存为JSON格式的性能追踪文件"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+        print(f"性能追踪已保存到: {path}")
+
+    def print_table(self):
+        """在终端打印各阶段耗时"""
+        print("=== 分阶段性能统计 ===")
+        for s in self.stages:
+            rss = s["peak_rss_bytes"]
+            rss_text = f"{rss / 1024 / 1024:.1f}MB" if rss is not None else "-"
+            if s["peak_rss_scope"] == "process":
+                rss_text += "(进程)"
+            delta = s["tracemalloc_delta_bytes"]
+            alloc_text = f"{delta / 1024:.1f}KB" if delta is not None else "-"
+            print(f"{s['stage']:<24} wall={s['wall_time_s']:.3f}s cpu={s['cpu_time_s']:.3f}s "
+                  f"peak_rss={rss_text} py_alloc={alloc_text} "
+                  f"rows/s={s['rows_per_s'] or '-'} written={s['bytes_written'] or '-'}")
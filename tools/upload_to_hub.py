@@ -9,7 +9,7 @@ import json
 from datasets import load_from_disk
 from huggingface_hub import HfApi, create_repo, login
 import argparse
-from typing import Optional
+from typing import Optional, Dict, Any
 
 class HuggingFaceUploader:
     def __init__(self, dataset_path: str, repo_name: str, token: Optional[str] = None):
@@ -45,18 +45,38 @@ class HuggingFaceUploader:
             print(f"❌ 创建仓库失败: {str(e)}")
             return False
     
+    def prepare_upload(self) -> Optional[Dict[str, Any]]:
+        """验证数据集并收集待上传文件信息"""
+        # 检查数据集路径
+        if not os.path.exists(self.dataset_path):
+            print(f"❌ 数据集路径不存在: {self.dataset_path}")
+            return None
+        
+        # 加载数据集以验证
+        dataset = load_from_disk(self.dataset_path)
+        num_examples = {split: len(dataset[split]) for split in dataset}
+        print(f"📊 数据集包含 {sum(num_examples.values())} 个样本: {num_examples}")
+        
+        files = []
+        total_bytes = 0
+        for root, _, names in os.walk(self.dataset_path):
+            for name in names:
+                file_path = os.path.join(root, name)
+                files.append(os.path.relpath(file_path, self.dataset_path))
+                total_bytes += os.path.getsize(file_path)
+        
+        return {
+            "num_examples": num_examples,
+            "files": sorted(files),
+            "total_bytes": total_bytes
+        }
+    
     def upload_dataset(self):
         """上传数据集"""
         try:
-            # 检查数据集路径
-            if not os.path.exists(self.dataset_path):
-                print(f"❌ 数据集路径不存在: {self.dataset_path}")
+            if self.prepare_upload() is None:
                 return False
             
-            # 加载数据集以验证
-            dataset = load_from_disk(self.dataset_path)
-            print(f"📊 数据集包含 {len(dataset['train'])} 个样本")
-            
             # 上传数据集
             self.api.upload_folder(
                 folder_path=self.dataset_path,